@@ -0,0 +1,311 @@
+import random
+import time
+
+from rules import MAX_SIZE, check_game_over, copy_board, legal_moves, move, position_key, unmove, variant_of
+
+MATE = 100000
+MAX_PLY = 128
+
+# Static evaluation weights, from the point of view of the side to move
+WEIGHTS = {
+    "man": 100,
+    "king": 300,
+    "advance": 3,
+    "back_rank": 10,
+}
+
+# Extra key bits for positions where a piece must keep capturing
+_pending_rng = random.Random(0xC0FFEE)
+PENDING_KEYS = [[_pending_rng.getrandbits(64) for _ in range(MAX_SIZE)] for _ in range(MAX_SIZE)]
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def evaluate(board, player, weights=WEIGHTS):
+    score = 0
+    size = len(board)
+    for r in range(size):
+        for c in range(size):
+            piece = board[r][c]
+            if not piece:
+                continue
+            if piece in (3, 4):
+                value = weights["king"]
+            else:
+                advance = r if piece == 1 else size - 1 - r
+                value = weights["man"] + weights["advance"] * advance
+                if advance == 0:
+                    value += weights["back_rank"]
+            score += value if piece in (1, 3) else -value
+    return score if player == 1 else -score
+
+
+class TranspositionTable:
+    # Fixed number of slots indexed by the low key bits. A slot is kept for
+    # the deeper search, except that entries left over from an earlier
+    # search are always replaced.
+    def __init__(self, size=1 << 18):
+        if size & (size - 1):
+            raise ValueError("transposition table size must be a power of two")
+        self.mask = size - 1
+        self.entries = [None] * size
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def clear(self):
+        self.entries = [None] * (self.mask + 1)
+
+    def probe(self, key):
+        self.probes += 1
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, value, flag, best):
+        slot = key & self.mask
+        old = self.entries[slot]
+        if old is None or old[0] == key or old[5] != self.generation or depth >= old[1]:
+            self.entries[slot] = (key, depth, value, flag, best, self.generation)
+
+
+def piece_count(board):
+    return sum(len(row) - row.count(0) for row in board)
+
+
+class Searcher:
+    # Negamax alpha-beta with iterative deepening inside a time budget.
+    # Captures are searched first, then killer moves, then by history score.
+    # With a tablebase, positions with few enough pieces are not searched;
+    # with an opening book, book positions are answered from the book.
+    def __init__(self, time_limit=1.0, max_depth=64, tt_size=1 << 18, weights=None, tablebase=None, book=None, tt=None):
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.weights = WEIGHTS if weights is None else {**WEIGHTS, **weights}
+        # tt may be any table with the TranspositionTable methods, e.g. the
+        # shared one in parallel.py
+        self.tt = TranspositionTable(tt_size) if tt is None else tt
+        self.tablebase = tablebase
+        self.tb_hits = 0
+        self.book = book
+        self.book_hit = False
+        self.history = {}
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.deadline = None
+        self.stop = None
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.elapsed = 0.0
+
+    @property
+    def nps(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    def stats(self):
+        return {
+            "nodes": self.nodes,
+            "depth": self.depth,
+            "score": self.score,
+            "elapsed": self.elapsed,
+            "nps": self.nps,
+            "tt_hit_rate": self.tt.hits / self.tt.probes if self.tt.probes else 0.0,
+            "tb_hits": self.tb_hits,
+            "book": self.book_hit,
+        }
+
+    def search(self, board, player, pending=None, time_limit=None, max_depth=None, stop=None, score_forced=False):
+        # Best (from, to, captured) for player, or None if there is no move.
+        # stop is an optional threading.Event that ends the search early. A
+        # single legal move is returned unsearched unless score_forced is set.
+        start = time.perf_counter()
+        self.stop = stop
+        limit = self.time_limit if time_limit is None else time_limit
+        max_depth = self.max_depth if max_depth is None else max_depth
+        self.deadline = start + limit if limit else None
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.tb_hits = 0
+        self.book_hit = False
+        self.tt.new_search()
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        for mv in self.history:
+            self.history[mv] //= 2
+
+        board = copy_board(board)
+        moves = legal_moves(board, player, pending)
+        if not moves:
+            self.elapsed = time.perf_counter() - start
+            return None
+        (frm, to), caps = next(iter(moves.items()))
+        best = (frm, to, caps)
+
+        if self.book is not None and pending is None:
+            choice = self.book.choose(board, player)
+            if choice is not None:
+                self.book_hit = True
+                self.elapsed = time.perf_counter() - start
+                return choice
+
+        if self.tablebase is not None and piece_count(board) <= self.tablebase.max_pieces:
+            answer = self.tablebase.best_move(board, player, pending)
+            if answer is not None:
+                best, (result, distance) = answer
+                self.tb_hits = 1
+                self.score = self._tb_score(result, distance, 0)
+                self.elapsed = time.perf_counter() - start
+                return best
+
+        if len(moves) > 1 or score_forced:
+            for depth in range(1, max_depth + 1):
+                try:
+                    score, found = self._root(board, player, pending, depth)
+                except SearchTimeout:
+                    break
+                best, self.score, self.depth = found, score, depth
+                if abs(score) >= MATE - MAX_PLY:
+                    break
+        self.elapsed = time.perf_counter() - start
+        return best
+
+    def search_root_move(self, board, player, frm, to, caps, depth, alpha, beta, deadline=None, stop=None):
+        # Value of one root move searched to depth within (alpha, beta), for
+        # searches that split the root moves between processes. Raises
+        # SearchTimeout at the deadline or once stop is set.
+        self.deadline = deadline
+        self.stop = stop
+        self.nodes = 0
+        self.tb_hits = 0
+        return self._child(board, player, frm, to, caps, depth, alpha, beta, 0)
+
+    def _tb_score(self, result, distance, ply):
+        # Tablebase outcome as a mate score, so faster wins score higher
+        if result > 0:
+            return MATE - ply - distance
+        if result < 0:
+            return ply + distance - MATE
+        return 0
+
+    def _key(self, board, player, pending):
+        key = position_key(board, player)
+        if pending is not None:
+            key ^= PENDING_KEYS[pending[0]][pending[1]]
+        return key
+
+    def _order(self, moves, tt_move, ply):
+        killers = self.killers[ply] if ply < MAX_PLY else ()
+        history = self.history
+
+        def priority(item):
+            mv, caps = item
+            if mv == tt_move:
+                return 1 << 30
+            if caps:
+                return (1 << 24) + len(caps)
+            if mv in killers:
+                return 1 << 23
+            return history.get(mv, 0)
+
+        return sorted(moves.items(), key=priority, reverse=True)
+
+    def _root(self, board, player, pending, depth):
+        key = self._key(board, player, pending)
+        entry = self.tt.probe(key)
+        moves = legal_moves(board, player, pending)
+        alpha, beta = -MATE - 1, MATE + 1
+        best = None
+        for (frm, to), caps in self._order(moves, entry[4] if entry else None, 0):
+            value = self._child(board, player, frm, to, caps, depth, alpha, beta, 0)
+            if best is None or value > alpha:
+                alpha = value
+                best = (frm, to, caps)
+        self.tt.store(key, depth, alpha, EXACT, best[:2])
+        return alpha, best
+
+    def _child(self, board, player, frm, to, caps, depth, alpha, beta, ply):
+        undo = move(board, frm[0], frm[1], to[0], to[1], caps)
+        # A man crowned by a capture keeps jumping as a king in the same turn,
+        # where the variant allows it
+        if (caps and board[to[0]][to[1]] != undo[0] and variant_of(board).continues
+                and legal_moves(board, player, to)):
+            value = self._negamax(board, player, to, depth, alpha, beta, ply + 1)
+        else:
+            value = -self._negamax(board, 3 - player, None, depth - 1, -beta, -alpha, ply + 1)
+        unmove(board, frm[0], frm[1], to[0], to[1], caps, undo)
+        return value
+
+    def _negamax(self, board, player, pending, depth, alpha, beta, ply):
+        self.nodes += 1
+        if not self.nodes & 255:
+            if self.deadline and time.perf_counter() > self.deadline:
+                raise SearchTimeout
+            if self.stop is not None and self.stop.is_set():
+                raise SearchTimeout
+
+        if pending is None:
+            winner = check_game_over(board)
+            if winner:
+                return MATE - ply if winner == player else ply - MATE
+            if self.tablebase is not None and piece_count(board) <= self.tablebase.max_pieces:
+                probed = self.tablebase.probe(board, player)
+                if probed is not None:
+                    self.tb_hits += 1
+                    return self._tb_score(*probed, ply)
+
+        moves = legal_moves(board, player, pending)
+        capture = any(moves.values())
+        # Quiescence: past the horizon only forced captures are followed
+        if (depth <= 0 and not capture) or ply >= MAX_PLY:
+            return evaluate(board, player, self.weights)
+
+        key = self._key(board, player, pending)
+        entry = self.tt.probe(key)
+        tt_move = None
+        if entry is not None:
+            tt_move = entry[4]
+            if entry[1] >= depth:
+                value, flag = entry[2], entry[3]
+                if flag == EXACT:
+                    return value
+                if flag == LOWER and value >= beta:
+                    return value
+                if flag == UPPER and value <= alpha:
+                    return value
+
+        alpha_orig = alpha
+        best_value = -MATE - 1
+        best_move = None
+        for mv, caps in self._order(moves, tt_move, ply):
+            value = self._child(board, player, mv[0], mv[1], caps, depth, alpha, beta, ply)
+            if value > best_value:
+                best_value = value
+                best_move = mv
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                if not caps:
+                    killers = self.killers[ply]
+                    if killers[0] != mv:
+                        killers[1] = killers[0]
+                        killers[0] = mv
+                    self.history[mv] = self.history.get(mv, 0) + depth * depth
+                break
+
+        if best_value <= alpha_orig:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, best_value, flag, best_move)
+        return best_value
@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from ai import MATE, MAX_PLY, Searcher
+from notation import fen_to_board, square_number
+from rules import POOL_LEGAL_CACHE_SIZE, VARIANTS, check_game_over, get_variant, legal_moves, set_legal_cache_size
+
+# Offline analysis of many positions, e.g. to look for blunders in archived
+# games. Reads one FEN per line (see notation.py) from a file or stdin and
+# writes one JSON object per position, in input order:
+#
+#   python analyze.py positions.txt --depth 8 > analysis.jsonl
+#   cat *.fen | python analyze.py --time 0.5 --tablebase endgame.cktb
+#
+# {"line", "fen", "moves": [{"move": "9x18", "captured": [14]}, ...],
+#  "forced_capture", "winner": 1, 2 or null (check_game_over),
+#  "eval": {"score", "mate", "best", "depth", "nodes"} or null}
+# The score is for the side to move; "mate" is the number of plies to a
+# forced win (negative for a loss) when the score is decisive. A line that
+# does not parse gives {"line", "fen", "error"}; blank lines and lines
+# starting with # are skipped. --depth 0 leaves out the engine.
+#
+# Lines go to a pool of worker processes in batches, and only a couple of
+# batches per worker are in flight at once, and the legal-move cache is
+# bounded, so memory stays flat however large the input is: about 17 MB per
+# process at --depth 1 for 3,000 or 60,000 distinct positions. Each position is searched with an empty table, so the
+# output does not depend on the number of workers.
+
+DEPTH = 6  # without --depth or --time
+TT_SIZE = 1 << 16
+IN_FLIGHT = 2  # batches queued per worker
+
+_searcher = None
+_variant = None
+
+
+def start_worker(variant_name, depth, time_limit, tablebase_path):
+    global _searcher, _variant
+    set_legal_cache_size(POOL_LEGAL_CACHE_SIZE)
+    _variant = get_variant(variant_name)
+    _searcher = None
+    if depth:
+        tablebase = None
+        if tablebase_path:
+            from tablebase import Tablebase
+            tablebase = Tablebase(tablebase_path)
+        _searcher = Searcher(time_limit=time_limit, max_depth=depth, tt_size=TT_SIZE, tablebase=tablebase)
+
+
+def move_text(frm, to, caps, size):
+    return f"{square_number(*frm, size)}{'x' if caps else '-'}{square_number(*to, size)}"
+
+
+def analyse(board, player, searcher=None):
+    size = len(board)
+    moves = legal_moves(board, player)
+    result = {
+        "moves": [{"move": move_text(frm, to, caps, size), "captured": [square_number(r, c, size) for r, c in caps]}
+                  for (frm, to), caps in moves.items()],
+        "forced_capture": any(moves.values()),
+        "winner": check_game_over(board),
+        "eval": None,
+    }
+    if searcher is not None and result["winner"] is None and moves:
+        searcher.tt.clear()
+        searcher.history = {}
+        best = searcher.search(board, player, score_forced=True)
+        score = searcher.score
+        mate = None
+        if abs(score) >= MATE - MAX_PLY:
+            mate = MATE - score if score > 0 else -(MATE + score)
+        result["eval"] = {"score": score, "mate": mate, "best": move_text(*best, size),
+                          "depth": searcher.depth, "nodes": searcher.nodes}
+    return result
+
+
+def analyse_batch(batch):
+    # [(line number, FEN), ...] -> JSONL text
+    out = []
+    for number, text in batch:
+        try:
+            board, player = fen_to_board(text, _variant)
+        except ValueError as e:
+            out.append(json.dumps({"line": number, "fen": text, "error": str(e)}))
+            continue
+        out.append(json.dumps({"line": number, "fen": text, **analyse(board, player, _searcher)}))
+    return "\n".join(out) + "\n"
+
+
+def batches(lines, size):
+    batch = []
+    for number, line in enumerate(lines, 1):
+        text = line.strip()
+        if not text or text.startswith("#"):
+            continue
+        batch.append((number, text))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run(lines, out, workers, batch_size, initargs):
+    # Writes the analysis of every batch in input order; returns the number
+    # of positions
+    count = 0
+    if workers < 1:
+        start_worker(*initargs)
+        for batch in batches(lines, batch_size):
+            out.write(analyse_batch(batch))
+            out.flush()
+            count += len(batch)
+        return count
+    with ProcessPoolExecutor(workers, initializer=start_worker, initargs=initargs) as pool:
+        in_flight = deque()
+        for batch in batches(lines, batch_size):
+            in_flight.append(pool.submit(analyse_batch, batch))
+            count += len(batch)
+            while len(in_flight) >= workers * IN_FLIGHT or (in_flight and in_flight[0].done()):
+                out.write(in_flight.popleft().result())
+                out.flush()
+        while in_flight:
+            out.write(in_flight.popleft().result())
+            out.flush()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse FEN positions, one per line, to JSONL")
+    parser.add_argument("input", nargs="?", default="-", help="FEN file, '-' for stdin")
+    parser.add_argument("--out", "-o", default="-", help="JSONL file, '-' for stdout")
+    parser.add_argument("--variant", choices=sorted(VARIANTS), default="classic")
+    parser.add_argument("--depth", type=int, help=f"search depth (default {DEPTH}), 0 for no engine")
+    parser.add_argument("--time", type=float, help="seconds per position, up to --depth if given")
+    parser.add_argument("--tablebase", help="endgame tablebase file (classic only)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="0 to analyse in this process")
+    parser.add_argument("--batch", type=int, default=64, help="positions sent to a worker at a time")
+    args = parser.parse_args(argv)
+    if args.tablebase and not os.path.isfile(args.tablebase):
+        parser.error(f"no tablebase file {args.tablebase!r} (see tablebase.py build)")
+
+    depth = args.depth
+    if depth is None:
+        depth = DEPTH if args.time is None else MAX_PLY
+    initargs = (args.variant, depth, args.time, args.tablebase)
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", errors="replace")
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    start = time.perf_counter()
+    try:
+        count = run(source, out, args.workers, max(1, args.batch), initargs)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(f"{count} positions in {elapsed:.1f}s ({count / elapsed if elapsed else 0:,.1f}/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
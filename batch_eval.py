@@ -0,0 +1,129 @@
+import numpy as np
+
+from ai import WEIGHTS
+from rules import COLS, ROWS
+
+# Vectorized evaluation of many positions at once, for tuning and training
+# runs. Boards are an (N, 8, 8) int8 array in the create_board() encoding;
+# NumPy is only needed by this module.
+#
+# Each board is packed into one uint64 per piece type (bit r*8+c), so a
+# step along a diagonal is a shift of the whole batch at once.
+#
+# Features are counted per side, as (N, 2) arrays with Red in column 0:
+#   man, king   material
+#   advance     rows travelled by the men
+#   back_rank   men still on their own back row
+#   mobility    quiet moves (men one step forward, kings along open diagonals)
+#   threats     enemy pieces that can be jumped right now
+
+FEATURES = ("man", "king", "advance", "back_rank", "mobility", "threats")
+DIAGONALS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+FORWARD = (1, -1)  # row direction of Red and White men
+
+_rows = [sum(1 << (r * COLS + c) for c in range(COLS)) for r in range(ROWS)]
+ROW_MASKS = np.array(_rows, dtype=np.uint64)
+NOT_FIRST_COL = np.uint64(sum(1 << (r * COLS) for r in range(ROWS)) ^ ((1 << ROWS * COLS) - 1))
+NOT_LAST_COL = np.uint64(sum(1 << (r * COLS + COLS - 1) for r in range(ROWS)) ^ ((1 << ROWS * COLS) - 1))
+
+
+def stack_boards(boards):
+    # List-of-lists boards to one (N, 8, 8) int8 array
+    return np.asarray(boards, dtype=np.int8).reshape(-1, ROWS, COLS)
+
+
+def _pack(mask):
+    # (N, 8, 8) bool to (N,) uint64
+    bits = np.packbits(mask.reshape(len(mask), ROWS * COLS), axis=1, bitorder="little")
+    return bits.view("<u8").reshape(len(mask))
+
+
+def _shift(bb, dr, dc):
+    # Every set square moved one step along (dr, dc); steps off the board vanish
+    if dc > 0:
+        bb = bb & NOT_LAST_COL
+    elif dc < 0:
+        bb = bb & NOT_FIRST_COL
+    delta = dr * COLS + dc
+    return bb << np.uint64(delta) if delta > 0 else bb >> np.uint64(-delta)
+
+
+def _count(bb):
+    return np.bitwise_count(bb).astype(np.int32)
+
+
+class _Bitboards:
+    def __init__(self, boards):
+        boards = np.asarray(boards, dtype=np.int8)
+        self.empty = _pack(boards == 0)
+        self.men = (_pack(boards == 1), _pack(boards == 2))
+        self.kings = (_pack(boards == 3), _pack(boards == 4))
+        self.pieces = (self.men[0] | self.kings[0], self.men[1] | self.kings[1])
+
+
+def _threatened(b, side):
+    # Enemy pieces that side can jump: an attacker behind the piece (a man
+    # next to it, or a king with open squares between) and an empty landing
+    # square beyond it
+    hit = np.zeros_like(b.empty)
+    for dr, dc in DIAGONALS:
+        target = b.pieces[1 - side] & _shift(b.empty, -dr, -dc)
+        attacked = _shift(b.men[side], dr, dc)
+        ray = _shift(b.kings[side], dr, dc)
+        while True:
+            attacked |= ray
+            ray = _shift(ray & b.empty, dr, dc)
+            if not ray.any():
+                break
+        hit |= target & attacked
+    return hit
+
+
+def _mobility(b, side):
+    total = np.zeros(len(b.empty), dtype=np.int32)
+    for dr, dc in DIAGONALS:
+        if dr == FORWARD[side]:
+            total += _count(_shift(b.men[side], dr, dc) & b.empty)
+        ray = _shift(b.kings[side], dr, dc) & b.empty
+        while ray.any():
+            total += _count(ray)
+            ray = _shift(ray, dr, dc) & b.empty
+    return total
+
+
+def features(boards):
+    # {name: (N, 2) int32 array of per-side counts}
+    b = _Bitboards(boards)
+    out = {name: np.zeros((len(b.empty), 2), dtype=np.int32) for name in FEATURES}
+    for side in (0, 1):
+        men = b.men[side]
+        out["man"][:, side] = _count(men)
+        out["king"][:, side] = _count(b.kings[side])
+        for r in range(ROWS):
+            advance = r if side == 0 else ROWS - 1 - r
+            on_row = _count(men & ROW_MASKS[r])
+            out["advance"][:, side] += advance * on_row
+            if advance == 0:
+                out["back_rank"][:, side] = on_row
+        out["mobility"][:, side] = _mobility(b, side)
+        out["threats"][:, side] = _count(_threatened(b, side))
+    return out
+
+
+def capture_available(boards):
+    # (N, 2) bool: whether Red / White has a capture, as any_capture_available()
+    b = _Bitboards(boards)
+    return np.stack([_threatened(b, side) != 0 for side in (0, 1)], axis=1)
+
+
+def evaluate_batch(boards, player, weights=WEIGHTS, feats=None):
+    # (N,) scores for player to move (a scalar or one per board). Weights
+    # missing from the dict count as zero, so the default weights give
+    # exactly ai.evaluate()
+    feats = features(boards) if feats is None else feats
+    score = np.zeros(len(feats["man"]), dtype=np.int64)
+    for name in FEATURES:
+        weight = weights.get(name, 0)
+        if weight:
+            score += weight * (feats[name][:, 0] - feats[name][:, 1]).astype(np.int64)
+    return np.where(np.asarray(player) == 1, score, -score)
@@ -0,0 +1,69 @@
+import argparse
+import random
+import time
+
+from bitboard import RC_TO_SQ, from_board, initial_position, make_move, side_moves, to_board
+import rules
+from rules import legal_moves
+
+
+def list_side_moves(board, player):
+    return [(frm, dest, caps) for (frm, dest), caps in legal_moves(board, player).items()]
+
+
+def sample_positions(count, seed):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        pos, player = initial_position(), 1
+        for _ in range(200):
+            moves = side_moves(pos, player)
+            if not moves:
+                break
+            positions.append((pos, player))
+            frm, to, caps = rng.choice(moves)
+            pos = make_move(pos, frm, to, caps)
+            player = 2 if player == 1 else 1
+    return positions[:count]
+
+
+def check(positions):
+    for pos, player in positions:
+        board = to_board(pos)
+        assert from_board(board) == pos
+        expected = [(RC_TO_SQ[f], RC_TO_SQ[t], [RC_TO_SQ[x] for x in caps]) for f, t, caps in list_side_moves(board, player)]
+        got = side_moves(pos, player)
+        if got != expected:
+            raise AssertionError(f"mismatch for {pos!r} player {player}: {got} != {expected}")
+
+
+def bench(label, fn, items, rounds):
+    moves = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for item, player in items:
+            rules._legal_cache.clear()  # time generation, not cache hits
+            moves += len(fn(item, player))
+    elapsed = time.perf_counter() - start
+    print(f"{label:10s} {moves / elapsed:12,.0f} moves/s {len(items) * rounds / elapsed:12,.0f} positions/s")
+    return moves / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare bitboard move generation with legal_moves")
+    parser.add_argument("--positions", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    positions = sample_positions(args.positions, args.seed)
+    check(positions)
+    boards = [(to_board(pos), player) for pos, player in positions]
+
+    old = bench("lists", list_side_moves, boards, args.rounds)
+    new = bench("bitboard", side_moves, positions, args.rounds)
+    print(f"speedup    {new / old:.1f}x over {len(positions)} positions (results identical)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import random
+import time
+
+from rules import COLS, ROWS, explore_captures
+
+
+def copying_explore_captures(board, row, col, piece, path=None, captured=None):
+    # Previous explore_captures, cloning the board on every jump; kept as the
+    # reference the in-place search is checked against.
+    if path is None:
+        path = [(row, col)]
+    if captured is None:
+        captured = []
+
+    directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+    enemy = {1: (2, 4), 2: (1, 3), 3: (2, 4), 4: (1, 3)}[piece]
+
+    longest_paths = []
+    max_length = 0
+
+    for dr, dc in directions:
+        if piece in (3, 4):
+            r1, c1 = row + dr, col + dc
+            while 0 <= r1 < ROWS and 0 <= c1 < COLS:
+                if board[r1][c1] == 0:
+                    r1 += dr
+                    c1 += dc
+                    continue
+                elif board[r1][c1] in enemy:
+                    r2, c2 = r1 + dr, c1 + dc
+                    while 0 <= r2 < ROWS and 0 <= c2 < COLS and board[r2][c2] == 0:
+                        new_board = [r.copy() for r in board]
+                        new_board[row][col] = 0
+                        new_board[r1][c1] = 0
+                        new_board[r2][c2] = piece
+                        sub_paths = copying_explore_captures(new_board, r2, c2, piece, path + [(r2, c2)], captured + [(r1, c1)])
+                        for p, cpts in sub_paths:
+                            if len(cpts) > max_length:
+                                longest_paths = [(p, cpts)]
+                                max_length = len(cpts)
+                            elif len(cpts) == max_length:
+                                longest_paths.append((p, cpts))
+                        r2 += dr
+                        c2 += dc
+                    break
+                else:
+                    break
+        else:
+            r1, c1 = row + dr, col + dc
+            r2, c2 = row + 2 * dr, col + 2 * dc
+            if 0 <= r2 < ROWS and 0 <= c2 < COLS:
+                if board[r1][c1] in enemy and board[r2][c2] == 0:
+                    new_board = [r.copy() for r in board]
+                    new_board[row][col] = 0
+                    new_board[r1][c1] = 0
+                    new_board[r2][c2] = piece
+                    sub_paths = copying_explore_captures(new_board, r2, c2, piece, path + [(r2, c2)], captured + [(r1, c1)])
+                    for p, cpts in sub_paths:
+                        if len(cpts) > max_length:
+                            longest_paths = [(p, cpts)]
+                            max_length = len(cpts)
+                        elif len(cpts) == max_length:
+                            longest_paths.append((p, cpts))
+
+    if not longest_paths:
+        return [(path, captured)]
+    return longest_paths
+
+
+def random_board(rng, pieces, king_ratio):
+    board = [[0 for _ in range(COLS)] for _ in range(ROWS)]
+    dark = [(r, c) for r in range(ROWS) for c in range(COLS) if (r + c) % 2 != 0]
+    for r, c in rng.sample(dark, pieces):
+        piece = rng.choice((1, 2))
+        if rng.random() < king_ratio:
+            piece += 2
+        board[r][c] = piece
+    return board
+
+
+def sample_starts(count, seed, king_ratio):
+    rng = random.Random(seed)
+    starts = []
+    while len(starts) < count:
+        board = random_board(rng, rng.randint(4, 20), king_ratio)
+        for r in range(ROWS):
+            for c in range(COLS):
+                if board[r][c]:
+                    starts.append((board, r, c))
+    return starts[:count]
+
+
+def check(starts):
+    for board, r, c in starts:
+        before = [row.copy() for row in board]
+        got = explore_captures(board, r, c, board[r][c])
+        expected = copying_explore_captures(board, r, c, board[r][c])
+        if got != expected:
+            raise AssertionError(f"mismatch at {(r, c)} on {board}: {got} != {expected}")
+        if board != before:
+            raise AssertionError(f"board not restored after search at {(r, c)}")
+
+
+def bench(label, fn, starts, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for board, r, c in starts:
+            fn(board, r, c, board[r][c])
+    elapsed = time.perf_counter() - start
+    rate = len(starts) * rounds / elapsed
+    print(f"{label:10s} {rate:12,.0f} searches/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time explore_captures against the board-copying search")
+    parser.add_argument("--starts", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--kings", type=float, default=0.5, help="fraction of random pieces that are kings")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    starts = sample_starts(args.starts, args.seed, args.kings)
+    check(starts)
+    old = bench("copying", copying_explore_captures, starts, args.rounds)
+    new = bench("in-place", explore_captures, starts, args.rounds)
+    print(f"speedup    {new / old:.1f}x over {len(starts)} random searches (results identical)")
+
+
+if __name__ == "__main__":
+    main()
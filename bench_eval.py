@@ -0,0 +1,54 @@
+import argparse
+import time
+
+import numpy as np
+
+from ai import evaluate
+from batch_eval import capture_available, evaluate_batch, stack_boards
+from bench_bitboard import sample_positions
+from bitboard import to_board
+from rules import any_capture_available
+
+
+def check(boards, players, scores, flags):
+    for i, (board, player) in enumerate(zip(boards, players)):
+        if scores[i] != evaluate(board, player):
+            raise AssertionError(f"score mismatch for {board!r}: {scores[i]} != {evaluate(board, player)}")
+        expected = [any_capture_available(board, side) for side in (1, 2)]
+        if list(flags[i]) != expected:
+            raise AssertionError(f"capture flags mismatch for {board!r}: {list(flags[i])} != {expected}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare batch evaluation with the scalar evaluate()")
+    parser.add_argument("--positions", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=100000, help="boards per batch call")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    positions = sample_positions(args.positions, args.seed)
+    boards = [to_board(pos) for pos, _ in positions]
+    players = [player for _, player in positions]
+
+    start = time.perf_counter()
+    for board, player in zip(boards, players):
+        evaluate(board, player)
+    scalar = len(boards) / (time.perf_counter() - start)
+    print(f"scalar   {scalar:12,.0f} positions/s")
+
+    array = stack_boards(boards)
+    repeat = -(-args.batch // len(array))
+    batch = np.tile(array, (repeat, 1, 1))[:args.batch]
+    batch_players = np.tile(np.array(players), repeat)[:args.batch]
+    start = time.perf_counter()
+    evaluate_batch(batch, batch_players)
+    capture_available(batch)
+    vector = len(batch) / (time.perf_counter() - start)
+    print(f"batch    {vector:12,.0f} positions/s (features, score and capture flags)")
+
+    check(boards, players, evaluate_batch(array, players), capture_available(array))
+    print(f"speedup  {vector / scalar:.1f}x over {len(boards)} positions (results identical)")
+
+
+if __name__ == "__main__":
+    main()
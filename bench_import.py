@@ -0,0 +1,77 @@
+import argparse
+import subprocess
+import sys
+
+# Import-time budget: the engine modules are imported by every self-play,
+# analysis and server worker, so they must stay cheap and must never pull
+# in pygame (or NumPy). Each module is timed in a fresh interpreter with
+# -X importtime; the best of several runs is compared with its budget.
+#
+#   python bench_import.py            # exits 1 if anything is over budget
+
+# Cumulative import time allowed per module, in milliseconds
+BUDGET_MS = {
+    "rules": 25,
+    "bitboard": 25,
+    "notation": 40,
+    "ai": 40,
+    "records": 60,
+    "tablebase": 60,
+    "book": 60,
+    "profiling": 40,
+    "parallel": 40,
+    "checkers": 40,
+}
+HEAVY = ("pygame", "numpy")
+
+
+def import_time(module):
+    # Cumulative microseconds for module, from -X importtime in a fresh process
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, check=True).stderr
+    for line in reversed(out.splitlines()):
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    raise RuntimeError(f"no import time reported for {module}")
+
+
+def heavy_imports(module):
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return [m for m in out.strip().split(",") if m]
+
+
+def opens_display():
+    # Importing the pygame front end must not initialize pygame or open a window
+    code = "import checkers, pygame; print(int(pygame.display.get_init()))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return out.strip().endswith("1")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check module import times against their budget")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for module, budget in BUDGET_MS.items():
+        ms = min(import_time(module) for _ in range(args.runs)) / 1000
+        heavy = heavy_imports(module)
+        ok = ms <= budget and not heavy
+        failed += not ok
+        note = f"  imports {', '.join(heavy)}" if heavy else ""
+        print(f"{module:10s} {ms:7.1f} ms  budget {budget:3d} ms  {'ok' if ok else 'OVER'}{note}")
+    if opens_display():
+        failed += 1
+        print("checkers   initializes pygame at import  FAIL")
+    else:
+        print("checkers   no display at import  ok")
+    if failed:
+        print(f"{failed} check(s) failed", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
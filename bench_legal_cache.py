@@ -0,0 +1,91 @@
+import argparse
+import random
+import sys
+import time
+
+import rules
+from ai import Searcher
+from rules import COLS, ROWS, Board, check_game_over, legal_cache_stats, play_move, set_legal_cache_size
+
+# Times engine self-play from random king-heavy endgames with the legal-move
+# cache off and on. Both runs must play the same moves with the same scores
+# and node counts; only the time may differ.
+#
+#   python bench_legal_cache.py --positions 10 --plies 10 --depth 5
+
+
+def random_endgame(rng, kings, men):
+    # kings and men per side; men never start on their crowning row
+    dark = [(r, c) for r in range(ROWS) for c in range(COLS) if (r + c) % 2 != 0]
+    squares = rng.sample(dark, 2 * (kings + men))
+    board = [[0 for _ in range(COLS)] for _ in range(ROWS)]
+    for side in (1, 2):
+        for _ in range(kings):
+            r, c = squares.pop()
+            board[r][c] = side + 2
+        for _ in range(men):
+            r, c = squares.pop()
+            crown = ROWS - 1 if side == 1 else 0
+            board[r][c] = side + 2 if r == crown else side
+    return Board(board)
+
+
+def self_play(start, plies, depth):
+    # (move, score, nodes) for every ply of a game from start
+    searcher = Searcher(time_limit=None, max_depth=depth, tt_size=1 << 16)
+    board, player, pending = rules.copy_board(start), 1, None
+    trace = []
+    for _ in range(plies):
+        if pending is None and check_game_over(board):
+            break
+        best = searcher.search(board, player, pending)
+        trace.append((best, searcher.score, searcher.nodes))
+        player, pending = play_move(board, player, *best)
+    return trace
+
+
+def run(starts, plies, depth, cache_size):
+    set_legal_cache_size(cache_size)
+    rules._legal_cache.clear()
+    start = time.perf_counter()
+    traces = [self_play(board, plies, depth) for board in starts]
+    return traces, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the legal-move cache on king endgames")
+    parser.add_argument("--positions", type=int, default=10)
+    parser.add_argument("--plies", type=int, default=10, help="self-play plies from each position")
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--kings", type=int, default=3, help="kings per side")
+    parser.add_argument("--men", type=int, default=1, help="men per side")
+    parser.add_argument("--size", type=int, default=rules.LEGAL_CACHE_SIZE, help="cache entries")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    starts = [random_endgame(rng, args.kings, args.men) for _ in range(args.positions)]
+    runs = []
+    for label, size in (("off", 0), ("on", args.size)):
+        traces, elapsed = run(starts, args.plies, args.depth, size)
+        runs.append((label, traces, elapsed, legal_cache_stats()))
+    set_legal_cache_size(rules.LEGAL_CACHE_SIZE)
+    if any(traces != runs[0][1] for _, traces, _, _ in runs):
+        print("results differ between cache sizes", file=sys.stderr)
+        return 1
+
+    traces = runs[0][1]
+    plies = sum(len(trace) for trace in traces)
+    nodes = sum(nodes for trace in traces for _, _, nodes in trace)
+    print(f"{len(starts)} endgames ({args.kings} kings + {args.men} men a side), {plies} plies, "
+          f"{nodes:,} nodes, depth {args.depth}: identical results")
+    base = runs[0][2]
+    for label, _, elapsed, stats in runs:
+        print(f"cache {label:3s} {elapsed:7.2f}s {nodes / elapsed:9,.0f} nodes/s  {base / elapsed:4.2f}x  "
+              f"hit rate {stats['hit_rate']:5.1%}  {stats['entries']:,}/{stats['size']:,} entries  "
+              f"{stats['evictions']:,} evictions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+# Bitboard positions and move generation for headless use, classic rules
+# only. Playable (dark) squares are numbered 0-31 row by row, so square
+# row * 4 + col // 2 is (row, col). A position is three 32-bit masks: red
+# pieces, white pieces and kings. Results match valid_moves() and
+# legal_moves() in rules.py: men capture in all four directions, kings fly,
+# and only the longest capture chains on the board may be played.
+
+ROWS, COLS = 8, 8
+DIRECTIONS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+SQ_TO_RC = [(sq // 4, 2 * (sq % 4) + (1 - (sq // 4) % 2)) for sq in range(32)]
+RC_TO_SQ = {rc: sq for sq, rc in enumerate(SQ_TO_RC)}
+BIT = [1 << sq for sq in range(32)]
+
+# RAYS[sq][d] lists the squares reached from sq walking in DIRECTIONS[d]
+RAYS = []
+for _sq in range(32):
+    _row, _col = SQ_TO_RC[_sq]
+    _rays = []
+    for _dr, _dc in DIRECTIONS:
+        _ray = []
+        _r, _c = _row + _dr, _col + _dc
+        while 0 <= _r < ROWS and 0 <= _c < COLS:
+            _ray.append(RC_TO_SQ[(_r, _c)])
+            _r += _dr
+            _c += _dc
+        _rays.append(tuple(_ray))
+    RAYS.append(tuple(_rays))
+RAYS = tuple(RAYS)
+
+# JUMPS[sq] holds (jumped, landing) square pairs for a man on sq
+JUMPS = tuple(tuple((ray[0], ray[1]) for ray in rays if len(ray) >= 2) for rays in RAYS)
+
+RED_FORWARD = 0
+WHITE_FORWARD = 1
+STEPS = (
+    tuple(tuple(rays[d][0] for d in (2, 3) if rays[d]) for rays in RAYS),
+    tuple(tuple(rays[d][0] for d in (0, 1) if rays[d]) for rays in RAYS),
+)
+RED_PROMOTION = sum(BIT[sq] for sq in range(28, 32))
+WHITE_PROMOTION = sum(BIT[sq] for sq in range(0, 4))
+FULL = (1 << 32) - 1
+
+
+class Position:
+    __slots__ = ("red", "white", "kings")
+
+    def __init__(self, red=0, white=0, kings=0):
+        self.red = red
+        self.white = white
+        self.kings = kings
+
+    def __eq__(self, other):
+        return (self.red, self.white, self.kings) == (other.red, other.white, other.kings)
+
+    def __hash__(self):
+        return hash((self.red, self.white, self.kings))
+
+    def __repr__(self):
+        return f"Position(red={self.red:#010x}, white={self.white:#010x}, kings={self.kings:#010x})"
+
+    def piece_at(self, sq):
+        b = BIT[sq]
+        if self.red & b:
+            return 3 if self.kings & b else 1
+        if self.white & b:
+            return 4 if self.kings & b else 2
+        return 0
+
+    def copy(self):
+        return Position(self.red, self.white, self.kings)
+
+
+def from_board(board):
+    pos = Position()
+    for sq, (r, c) in enumerate(SQ_TO_RC):
+        piece = board[r][c]
+        if piece in (1, 3):
+            pos.red |= BIT[sq]
+        elif piece in (2, 4):
+            pos.white |= BIT[sq]
+        if piece in (3, 4):
+            pos.kings |= BIT[sq]
+    return pos
+
+
+def to_board(pos):
+    board = [[0 for _ in range(COLS)] for _ in range(ROWS)]
+    for sq, (r, c) in enumerate(SQ_TO_RC):
+        board[r][c] = pos.piece_at(sq)
+    return board
+
+
+def initial_position():
+    return Position(red=sum(BIT[sq] for sq in range(12)), white=sum(BIT[sq] for sq in range(20, 32)))
+
+
+def squares(mask):
+    while mask:
+        b = mask & -mask
+        yield b.bit_length() - 1
+        mask ^= b
+
+
+def _man_captures(sq, enemy, empty, path, captured, leaves):
+    found = False
+    for over, land in JUMPS[sq]:
+        if enemy & BIT[over] and empty & BIT[land]:
+            found = True
+            path.append(land)
+            captured.append(over)
+            _man_captures(land, enemy & ~BIT[over], (empty | BIT[sq] | BIT[over]) & ~BIT[land], path, captured, leaves)
+            path.pop()
+            captured.pop()
+    if not found:
+        leaves.append((path[-1], captured[:]))
+
+
+def _king_captures(sq, enemy, empty, path, captured, leaves):
+    found = False
+    for ray in RAYS[sq]:
+        i, n = 0, len(ray)
+        while i < n and empty & BIT[ray[i]]:
+            i += 1
+        if i >= n or not enemy & BIT[ray[i]]:
+            continue
+        over = ray[i]
+        after = empty | BIT[sq] | BIT[over]
+        j = i + 1
+        while j < n and empty & BIT[ray[j]]:
+            land = ray[j]
+            found = True
+            path.append(land)
+            captured.append(over)
+            _king_captures(land, enemy & ~BIT[over], after & ~BIT[land], path, captured, leaves)
+            path.pop()
+            captured.pop()
+            j += 1
+    if not found:
+        leaves.append((path[-1], captured[:]))
+
+
+def _can_capture(sq, king, enemy, empty):
+    if not king:
+        for over, land in JUMPS[sq]:
+            if enemy & BIT[over] and empty & BIT[land]:
+                return True
+        return False
+    for ray in RAYS[sq]:
+        i, n = 0, len(ray)
+        while i < n and empty & BIT[ray[i]]:
+            i += 1
+        if i + 1 < n and enemy & BIT[ray[i]] and empty & BIT[ray[i + 1]]:
+            return True
+    return False
+
+
+def _captures(sq, king, enemy, empty):
+    if not _can_capture(sq, king, enemy, empty):
+        return {}
+    leaves = []
+    if king:
+        _king_captures(sq, enemy, empty, [sq], [], leaves)
+    else:
+        _man_captures(sq, enemy, empty, [sq], [], leaves)
+    best = max(len(caps) for _, caps in leaves)
+    moves = {}
+    for dest, caps in leaves:
+        if len(caps) == best:
+            moves[dest] = caps
+    return moves
+
+
+def _quiet(sq, king, forward, empty):
+    moves = {}
+    if king:
+        for ray in RAYS[sq]:
+            for to in ray:
+                if not empty & BIT[to]:
+                    break
+                moves[to] = []
+    else:
+        for to in STEPS[forward][sq]:
+            if empty & BIT[to]:
+                moves[to] = []
+    return moves
+
+
+def _sides(pos, sq):
+    b = BIT[sq]
+    if pos.red & b:
+        return pos.white, RED_FORWARD
+    if pos.white & b:
+        return pos.red, WHITE_FORWARD
+    return None, None
+
+
+def piece_captures(pos, sq):
+    enemy, _ = _sides(pos, sq)
+    if enemy is None:
+        return {}
+    return _captures(sq, pos.kings & BIT[sq], enemy, FULL & ~(pos.red | pos.white))
+
+
+def piece_moves(pos, sq):
+    # Same contract as valid_moves(board, row, col), on square numbers
+    enemy, forward = _sides(pos, sq)
+    if enemy is None:
+        return {}
+    king = pos.kings & BIT[sq]
+    empty = FULL & ~(pos.red | pos.white)
+    return _captures(sq, king, enemy, empty) or _quiet(sq, king, forward, empty)
+
+
+def side_moves(pos, player, pending=None):
+    # All (from, to, captured) moves for player in legal_moves() order. With
+    # pending set only that piece may move, and only by capturing.
+    if pending is not None:
+        return [(pending, to, caps) for to, caps in piece_captures(pos, pending).items()]
+    if player == 1:
+        own, enemy, forward = pos.red, pos.white, RED_FORWARD
+    else:
+        own, enemy, forward = pos.white, pos.red, WHITE_FORWARD
+    kings = pos.kings
+    empty = FULL & ~(pos.red | pos.white)
+    moves = []
+    best = 0
+    for sq in squares(own):
+        for to, caps in _captures(sq, kings & BIT[sq], enemy, empty).items():
+            if len(caps) > best:
+                best = len(caps)
+                moves = []
+            if len(caps) == best:
+                moves.append((sq, to, caps))
+    if moves:
+        return moves
+    for sq in squares(own):
+        for to in _quiet(sq, kings & BIT[sq], forward, empty):
+            moves.append((sq, to, []))
+    return moves
+
+
+def capture_available(pos, player):
+    if player == 1:
+        own, enemy = pos.red, pos.white
+    else:
+        own, enemy = pos.white, pos.red
+    empty = FULL & ~(pos.red | pos.white)
+    return any(_can_capture(sq, pos.kings & BIT[sq], enemy, empty) for sq in squares(own))
+
+
+def winner(pos):
+    # Same result as check_game_over() in rules.py
+    for player in (1, 2):
+        if not side_moves(pos, player):
+            return 2 if player == 1 else 1
+    return None
+
+
+def make_move(pos, frm, to, captured):
+    # Returns the position after the move, crowning like king_if_needed()
+    red, white, kings = pos.red, pos.white, pos.kings
+    fb, tb = BIT[frm], BIT[to]
+    removed = 0
+    for sq in captured:
+        removed |= BIT[sq]
+    if red & fb:
+        red = (red & ~fb) | tb
+        white &= ~removed
+        promote = RED_PROMOTION
+    else:
+        white = (white & ~fb) | tb
+        red &= ~removed
+        promote = WHITE_PROMOTION
+    if kings & fb:
+        kings = (kings & ~fb & ~removed) | tb
+    else:
+        kings &= ~removed
+        if tb & promote:
+            kings |= tb
+    return Position(red, white, kings)
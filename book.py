@@ -0,0 +1,202 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+from bitboard import RC_TO_SQ, SQ_TO_RC
+from records import DRAW, UNFINISHED, read_games, start_position
+from rules import legal_moves, play_move, position_key
+
+# Opening book: for positions from the first plies of recorded games, the
+# moves played there with how often they won, drew and lost for the side
+# that played them.
+#
+#   python book.py add opening.ckbk games.ckg more.ckg --plies 16
+#   python book.py show opening.ckbk --fen "B:W21-32:B1-12"
+#
+# "add" merges into an existing book, so new archives can be folded in as
+# they arrive. Books from deep searches come from self-play archives, e.g.
+# selfplay.py alphabeta:8 alphabeta:8 --random-plies 6 --out deep.ckg.
+#
+# File layout (little-endian): a 16-byte header (magic, version, plies,
+# entry count), then 24-byte entries sorted by (position key, move): the
+# position_key() of the position, the move as from | to << 5 in bitboard
+# squares, two reserved bytes, then wins, draws and losses as uint32.
+# Positions inside a continuing jump are not in the book.
+
+MAGIC = b"CKBK"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQ")
+ENTRY = struct.Struct("<QHHIII")
+KEY = struct.Struct("<Q")
+
+
+def encode_move(frm, to):
+    return RC_TO_SQ[tuple(frm)] | RC_TO_SQ[tuple(to)] << 5
+
+
+def decode_move(code):
+    return SQ_TO_RC[code & 31], SQ_TO_RC[code >> 5 & 31]
+
+
+def score(wins, draws, losses):
+    # Expected result with one win and one loss added, so that a move
+    # played once does not outrank one with a long good record
+    return (wins + draws / 2 + 1) / (wins + draws + losses + 2)
+
+
+def count_games(games, plies):
+    # {(key, move): [wins, draws, losses]} over the first plies of each game
+    counts = {}
+    for game in games:
+        result = game["result"]
+        if result == UNFINISHED:
+            continue
+        board, player = start_position(game)
+        pending = None
+        for frm, to, caps in game["moves"][:plies]:
+            if pending is None:
+                stats = counts.setdefault((position_key(board, player), encode_move(frm, to)), [0, 0, 0])
+                stats[0 if result == player else 1 if result == DRAW else 2] += 1
+            player, pending = play_move(board, player, frm, to, caps)
+    return counts
+
+
+def _merge(old, new):
+    # Two sorted streams of (key, move, wins, draws, losses), summed
+    old, new = iter(old), iter(new)
+    a, b = next(old, None), next(new, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[:2] < b[:2]):
+            yield a
+            a = next(old, None)
+        elif a is None or b[:2] < a[:2]:
+            yield b
+            b = next(new, None)
+        else:
+            yield (a[0], a[1], a[2] + b[2], a[3] + b[3], a[4] + b[4])
+            a, b = next(old, None), next(new, None)
+
+
+def write_book(path, entries, plies):
+    count = 0
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, plies, 0))
+        for key, move, wins, draws, losses in entries:
+            f.write(ENTRY.pack(key, move, 0, wins, draws, losses))
+            count += 1
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, plies, count))
+    return count
+
+
+def add_games(path, games, plies):
+    # Merges games into the book at path, creating it if needed. The new
+    # book is written next to the old one and then replaces it.
+    counts = count_games(games, plies)
+    new = sorted((key, move, *stats) for (key, move), stats in counts.items())
+    if not os.path.exists(path):
+        return write_book(path, new, plies)
+    book = Book(path)
+    try:
+        count = write_book(path + ".tmp", _merge(book.entries(), new), max(plies, book.plies))
+    finally:
+        book.close()
+    os.replace(path + ".tmp", path)
+    return count
+
+
+class Book:
+    # Read-only view of a book file; nothing is parsed when loading
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.plies, self.count = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} opening book")
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+    def _key_at(self, i):
+        return KEY.unpack_from(self.mm, HEADER.size + i * ENTRY.size)[0]
+
+    def entries(self):
+        for i in range(self.count):
+            key, move, _, wins, draws, losses = ENTRY.unpack_from(self.mm, HEADER.size + i * ENTRY.size)
+            yield key, move, wins, draws, losses
+
+    def lookup(self, key):
+        # [(move code, wins, draws, losses)] stored for a position key
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        found = []
+        while lo < self.count and self._key_at(lo) == key:
+            _, move, _, wins, draws, losses = ENTRY.unpack_from(self.mm, HEADER.size + lo * ENTRY.size)
+            found.append((move, wins, draws, losses))
+            lo += 1
+        return found
+
+    def moves(self, board, player):
+        # Legal book moves as ((from, to, captured), wins, draws, losses),
+        # best first
+        legal = legal_moves(board, player)
+        ranked = []
+        for move, wins, draws, losses in self.lookup(position_key(board, player)):
+            frm, to = decode_move(move)
+            if (frm, to) in legal:
+                ranked.append(((frm, to, legal[(frm, to)]), wins, draws, losses))
+        ranked.sort(key=lambda item: score(*item[1:]), reverse=True)
+        return ranked
+
+    def choose(self, board, player, min_games=1):
+        for mv, wins, draws, losses in self.moves(board, player):
+            if wins + draws + losses >= min_games:
+                return mv
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect an opening book")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="merge game archives into a book")
+    add.add_argument("book")
+    add.add_argument("archives", nargs="+")
+    add.add_argument("--plies", type=int, default=16, help="plies from the start of each game to keep")
+    show = sub.add_parser("show", help="list the book moves for a position")
+    show.add_argument("book")
+    show.add_argument("--fen", default="B:W21-32:B1-12")
+    args = parser.parse_args(argv)
+
+    if args.command == "add":
+        def games():
+            for path in args.archives:
+                with open(path, "rb") as f:
+                    yield from read_games(f)
+
+        count = add_games(args.book, games(), args.plies)
+        print(f"{args.book}: {count} entries")
+        return 0
+
+    from notation import fen_to_board, square_number
+    board, player = fen_to_board(args.fen)
+    book = Book(args.book)
+    moves = book.moves(board, player)
+    if not moves:
+        print("position not in the book")
+        return 1
+    for (frm, to, caps), wins, draws, losses in moves:
+        label = f"{square_number(*frm)}{'x' if caps else '-'}{square_number(*to)}"
+        print(f"{label:8s} {wins + draws + losses:8d} games  +{wins} ={draws} -{losses}  score {score(wins, draws, losses):.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
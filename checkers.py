@@ -1,12 +1,19 @@
-import pygame
+import argparse
 import sys
+import os
 import random
+import time
+from collections import deque
 
-pygame.init()
+from rules import (CLASSIC, COLS, ROWS, VARIANTS, any_capture_available, check_game_over, copy_board, create_board,
+                   explore_captures, get_variant, king_if_needed, legal_moves, move, next_turn, play_move, valid_moves)
+
+# pygame and the engine, book, tablebase and archive modules are imported in
+# init_display(), main() and replay_viewer(), so that importing this module
+# costs no more than the rules
 
 # Constants
 WIDTH, HEIGHT = 650, 650
-ROWS, COLS = 8, 8
 SQUARE_SIZE = 650 // COLS
 
 # Colors
@@ -29,10 +36,37 @@ BUTTON_Y = 290
 BUTTON_HEIGHT = 70
 BUTTON_SPACING = 70
 
-# Pygame setup
-WIN = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Checkers")
-font = pygame.font.SysFont(None, 40)
+# Thinking time per computer move, in seconds
+AI_TIME = 1.0
+
+# Processes the computer searches with; one searches in this process. More
+# than a few cost start-up time and memory for little gain.
+AI_WORKERS = min(4, os.cpu_count() or 1)
+
+# Endgame tablebase used by the computer when present (python tablebase.py build)
+TABLEBASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "endgame.cktb")
+
+# Opening book used by the computer when present (python book.py add)
+BOOK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening.ckbk")
+
+# Every game played is appended here (see records.py)
+GAMES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "games.ckg")
+
+# Pygame setup happens in init_display(), when a window is actually
+# wanted, so importing this module opens nothing
+pygame = None
+WIN = None
+font = None
+small_font = None
+
+def init_display():
+    global pygame, WIN, font, small_font
+    import pygame
+    pygame.init()
+    WIN = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Checkers")
+    font = pygame.font.SysFont(None, 40)
+    small_font = pygame.font.SysFont(None, 24)
 
 class Button:
     def __init__(self, x, y, w, h, text, color, hover_color):
@@ -40,59 +74,163 @@ class Button:
         self.text = text
         self.color = color
         self.hover_color = hover_color
+        # Both looks are rendered once, drawing is a single blit
+        self.surfaces = {False: self._render(color), True: self._render(hover_color)}
 
-    def draw(self, win):
-        mouse_pos = pygame.mouse.get_pos()
-        color = self.hover_color if self.rect.collidepoint(mouse_pos) else self.color
-
+    def _render(self, color):
         s = pygame.Surface((self.rect.width, self.rect.height), pygame.SRCALPHA)
         pygame.draw.rect(s, (*color, 220), s.get_rect(), border_radius=BUTTON_BORDER_RADIUS)
-        win.blit(s, (self.rect.x, self.rect.y))
+        pygame.draw.rect(s, BLACK, s.get_rect(), 2, border_radius=BUTTON_BORDER_RADIUS)
+        txt_surface = font.render(self.text, True, BLACK)
+        s.blit(txt_surface, txt_surface.get_rect(center=s.get_rect().center))
+        return s
 
-        pygame.draw.rect(win, BLACK, self.rect, 2, border_radius=BUTTON_BORDER_RADIUS)
+    def overlay(self, mouse_pos):
+        hovered = bool(self.rect.collidepoint(mouse_pos))
+        return ("button", self.text, hovered), self.surfaces[hovered], self.rect
 
-        txt_surface = font.render(self.text, True, BLACK)
-        txt_rect = txt_surface.get_rect(center=self.rect.center)
-        win.blit(txt_surface, txt_rect)
+    def draw(self, win):
+        _, surface, rect = self.overlay(pygame.mouse.get_pos())
+        win.blit(surface, rect)
 
     def is_clicked(self, pos):
         return self.rect.collidepoint(pos)
 
+class FrameTimer:
+    # Time spent drawing and handling input per frame, over the last frames
+    def __init__(self, size=120):
+        self.samples = deque(maxlen=size)
+
+    def add(self, ms):
+        self.samples.append(ms)
+
+    def average(self):
+        return sum(self.samples) / len(self.samples) if self.samples else 0.0
+
+    def worst(self):
+        return max(self.samples, default=0.0)
+
+    def text(self, clock):
+        return f"frame {self.average():.1f} ms  max {self.worst():.1f} ms  {clock.get_fps():.0f} fps"
+
+def set_board_size(size):
+    # Squares and board position for a size x size board
+    global ROWS, COLS, SQUARE_SIZE, BOARD_OFFSET_X
+    ROWS = COLS = size
+    SQUARE_SIZE = 650 // COLS
+    BOARD_OFFSET_X = (WIDTH - (SQUARE_SIZE * COLS)) // 2
+
+def square_rect(row, col):
+    return pygame.Rect(BOARD_OFFSET_X + col * SQUARE_SIZE, BOARD_OFFSET_Y + row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+
 def draw_board(win):
     for row in range(ROWS):
         for col in range(COLS):
             color = BEIGE if (row + col) % 2 == 0 else BROWN
-            pygame.draw.rect(win, color, (BOARD_OFFSET_X + col * SQUARE_SIZE, BOARD_OFFSET_Y + row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-
-def draw_pieces(win, board, selected=None):
-    for row in range(ROWS):
-        for col in range(COLS):
-            piece = board[row][col]
+            pygame.draw.rect(win, color, square_rect(row, col))
+
+def render_piece(piece):
+    s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
+    color = RED if piece in (1, 3) else WHITE
+    center = (SQUARE_SIZE // 2, SQUARE_SIZE // 2)
+    radius = SQUARE_SIZE // 2 - 10
+    pygame.draw.circle(s, BLACK, center, radius + 2)
+    pygame.draw.circle(s, color, center, radius)
+    if piece in (3, 4):
+        crown_text = font.render("K", True, (255, 215, 0))
+        s.blit(crown_text, crown_text.get_rect(center=center))
+    return s
+
+class Renderer:
+    # Remembers how every square and overlay looked on the last frame and
+    # only redraws, and sends to the display, the parts that changed. The
+    # board, pieces, buttons and texts are pre-rendered surfaces.
+    def __init__(self, win):
+        self.win = win
+        self.background = pygame.Surface((WIDTH, HEIGHT))
+        self.background.fill(BEIGE)
+        draw_board(self.background)
+        self.sprites = {piece: render_piece(piece) for piece in (1, 2, 3, 4)}
+        self.rects = {(row, col): square_rect(row, col) for row in range(ROWS) for col in range(COLS)}
+        self.texts = {}
+        self.invalidate()
+
+    def invalidate(self):
+        # Redraw everything on the next frame (e.g. after the window is exposed)
+        self.squares = {}
+        self.overlays = []
+        self.full = True
+
+    def text(self, message, small=False, background=None):
+        key = (message, small, background)
+        surface = self.texts.get(key)
+        if surface is None:
+            if len(self.texts) > 64:
+                self.texts.clear()
+            surface = (small_font if small else font).render(message, True, BLACK, background)
+            self.texts[key] = surface
+        return surface
+
+    def draw(self, board, selected, targets, overlays):
+        # overlays are (key, surface, rect) drawn over the board; a changed
+        # key means a changed picture. Returns True if anything was drawn.
+        looks = {}
+        for row in range(ROWS):
+            for col in range(COLS):
+                looks[(row, col)] = (board[row][col], (row, col) == selected, (row, col) in targets)
+        dirty = {sq for sq, look in looks.items() if self.squares.get(sq) != look}
+
+        overlay_keys = [(key, tuple(rect)) for key, _, rect in overlays]
+        changed = []
+        if overlay_keys != self.overlays:
+            changed = [pygame.Rect(rect) for _, rect in self.overlays] + [pygame.Rect(rect) for _, _, rect in overlays]
+        for rect in changed:
+            dirty.update(self._squares_under(rect))
+
+        # An overlay touching a redrawn square is redrawn whole, together
+        # with every square under it
+        redraw = set()
+        grew = True
+        while grew:
+            grew = False
+            for i, (_, _, rect) in enumerate(overlays):
+                if i not in redraw and any(self.rects[sq].colliderect(rect) for sq in dirty):
+                    redraw.add(i)
+                    dirty.update(self._squares_under(rect))
+                    grew = True
+
+        if not dirty and not changed and not self.full:
+            return False
+
+        if self.full:
+            self.win.blit(self.background, (0, 0))
+        for rect in changed:
+            self.win.blit(self.background, rect, rect)
+        for sq in dirty:
+            rect = self.rects[sq]
+            self.win.blit(self.background, rect, rect)
+            piece, is_selected, is_target = looks[sq]
             if piece:
-                color = RED if piece in (1, 3) else WHITE
-                is_king = piece in (3, 4)
-                x = BOARD_OFFSET_X + col * SQUARE_SIZE + SQUARE_SIZE // 2
-                y = BOARD_OFFSET_Y + row * SQUARE_SIZE + SQUARE_SIZE // 2
-                radius = SQUARE_SIZE // 2 - 10
-                pygame.draw.circle(win, BLACK, (x, y), radius + 2)
-                pygame.draw.circle(win, color, (x, y), radius)
-                if is_king:
-                    crown_text = font.render("K", True, (255, 215, 0))
-                    win.blit(crown_text, crown_text.get_rect(center=(x, y)))
-    if selected:
-        row, col = selected
-        pygame.draw.rect(win, HIGHLIGHT, (BOARD_OFFSET_X + col * SQUARE_SIZE, BOARD_OFFSET_Y + row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE), 4)
-
-def create_board():
-    board = [[0 for _ in range(COLS)] for _ in range(ROWS)]
-    for row in range(ROWS):
-        for col in range(COLS):
-            if (row + col) % 2 != 0:
-                if row < 3:
-                    board[row][col] = 1
-                elif row > 4:
-                    board[row][col] = 2
-    return board
+                self.win.blit(self.sprites[piece], rect)
+            if is_selected:
+                pygame.draw.rect(self.win, HIGHLIGHT, rect, 4)
+            if is_target:
+                pygame.draw.rect(self.win, (0, 255, 255), rect, 3)
+        for i, (_, surface, rect) in enumerate(overlays):
+            if self.full or i in redraw:
+                self.win.blit(surface, rect)
+
+        if self.full:
+            pygame.display.update()
+        else:
+            pygame.display.update([self.rects[sq] for sq in dirty] + changed)
+        self.squares = looks
+        self.overlays = overlay_keys
+        self.full = False
+        return True
+
+    def _squares_under(self, rect):
+        return [sq for sq, square in self.rects.items() if square.colliderect(rect)]
 
 def get_row_col_from_mouse(pos):
     x, y = pos
@@ -106,268 +244,52 @@ def get_row_col_from_mouse(pos):
         return row, col
     return None
 
-def explore_captures(board, row, col, piece, path=None, captured=None):
-    if path is None:
-        path = [(row, col)]
-    if captured is None:
-        captured = []
-
-    directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]  # all diagonals
-    enemy = {1: (2, 4), 2: (1, 3), 3: (2, 4), 4: (1, 3)}[piece]
-
-    longest_paths = []
-    max_length = 0
-
-    for dr, dc in directions:
-        r, c = row, col
-
-        if piece in (3, 4):  # King: can move multiple steps diagonally, like bishop
-                        r1, c1 = row + dr, col + dc
-                        while 0 <= r1 < ROWS and 0 <= c1 < COLS:
-                            if board[r1][c1] == 0:
-                                r1 += dr
-                                c1 += dc
-                                continue  # Empty square, keep searching
-                            elif board[r1][c1] in enemy:
-                                r2, c2 = r1 + dr, c1 + dc
-                                while 0 <= r2 < ROWS and 0 <= c2 < COLS and board[r2][c2] == 0:
-                                    new_board = [r.copy() for r in board]
-                                    new_board[row][col] = 0
-                                    new_board[r1][c1] = 0
-                                    new_board[r2][c2] = piece
-                                    sub_paths = explore_captures(new_board, r2, c2, piece, path + [(r2, c2)], captured + [(r1, c1)])
-                                    for p, cpts in sub_paths:
-                                        if len(cpts) > max_length:
-                                            longest_paths = [(p, cpts)]
-                                            max_length = len(cpts)
-                                        elif len(cpts) == max_length:
-                                            longest_paths.append((p, cpts))
-                                    r2 += dr
-                                    c2 += dc
-                                break  # only one piece can be captured in a direction per jump
-                            else:
-                                break  # blocked by own piece or other obstacle
-
-
-        else:
-            # Regular piece: only jump 2 steps diagonally
-            r1, c1 = row + dr, col + dc
-            r2, c2 = row + 2 * dr, col + 2 * dc
-            if 0 <= r2 < ROWS and 0 <= c2 < COLS:
-                if board[r1][c1] in enemy and board[r2][c2] == 0:
-                    new_board = [row.copy() for row in board]
-                    new_board[row][col] = 0
-                    new_board[r1][c1] = 0
-                    new_board[r2][c2] = piece
-                    sub_paths = explore_captures(new_board, r2, c2, piece, path + [(r2, c2)], captured + [(r1, c1)])
-
-                    for p, cpts in sub_paths:
-                        if len(cpts) > max_length:
-                            longest_paths = [(p, cpts)]
-                            max_length = len(cpts)
-                        elif len(cpts) == max_length:
-                            longest_paths.append((p, cpts))
-
-    if not longest_paths:
-        return [(path, captured)]
-    return longest_paths
-
-
-def valid_moves(board, row, col):
-    piece = board[row][col]
-    if not piece:
-        return {}
-
-    all_moves = {}
-
-    # 1. Explore captures first (for kings and normal pieces)
-    captures = explore_captures(board, row, col, piece, path=[(row, col)], captured=[])
-    max_capture_len = 0
-
-    for path, captured in captures:
-        capture_len = len(captured)
-        if capture_len > max_capture_len:
-            max_capture_len = capture_len
-            all_moves = {path[-1]: captured}
-        elif capture_len == max_capture_len and capture_len > 0:
-            all_moves[path[-1]] = captured
-
-    # Filter only max-length captures if any
-    if max_capture_len > 0:
-        all_moves = {move: caps for move, caps in all_moves.items() if len(caps) == max_capture_len}
-        return all_moves
-
-
-    # 2. No captures found, generate normal moves
-    directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-
-    if piece in (3, 4):  # King: can slide freely diagonally
-        for dr, dc in directions:
-            r, c = row + dr, col + dc
-            while 0 <= r < ROWS and 0 <= c < COLS:
-                if board[r][c] == 0:
-                    all_moves[(r, c)] = []
-                else:
-                    break
-                r += dr
-                c += dc
-    else:
-        # Normal pieces move one step diagonally forward only
-        forward_dirs = [(-1, -1), (-1, 1)] if piece == 2 else [(1, -1), (1, 1)]
-        for dr, dc in forward_dirs:
-            r, c = row + dr, col + dc
-            if 0 <= r < ROWS and 0 <= c < COLS and board[r][c] == 0:
-                all_moves[(r, c)] = []
-
-    return all_moves
-
-
-def move(board, from_row, from_col, to_row, to_col, captured_positions):
-    piece = board[from_row][from_col]
-    board[from_row][from_col] = 0
-    board[to_row][to_col] = piece
-
-    for r, c in captured_positions:
-        board[r][c] = 0
-
-    king_if_needed(board, to_row, to_col)
-
-
-def any_capture_available(board, player):
-    player_pieces = [player, player + 2]
-    for r in range(ROWS):
-        for c in range(COLS):
-            if board[r][c] in player_pieces:
-                for cap in valid_moves(board, r, c).values():
-                    if cap:
-                        return True
-    return False
-
-def king_if_needed(board, row, col):
-    if board[row][col] == 1 and row == ROWS - 1:
-        board[row][col] = 3
-    elif board[row][col] == 2 and row == 0:
-        board[row][col] = 4
-
-def get_king_captures(board, r, c):
-    captures = []
-    directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]  # all diagonal directions
-    n = len(board)
-    piece = board[r][c]
-    enemy = {3: (1, 2), 4: (1, 2)}[piece]
-
-    for dr, dc in directions:
-        found_opponent = False
-        opponent_pos = None
-        row, col = r + dr, c + dc
-
-        while 0 <= row < n and 0 <= col < n:
-            cell = board[row][col]
-            if cell == 0:
-                if found_opponent:
-                    captures.append({
-                        'start': (r, c),
-                        'captured': [opponent_pos],
-                        'end': (row, col)
-                    })
-                    break
-            elif cell in enemy:
-                if found_opponent:
-                    break  # Cannot capture more than one piece in a straight line without landing
-                found_opponent = True
-                opponent_pos = (row, col)
-            else:
-                break  # Blocked by own piece or invalid
-            row += dr
-            col += dc
-
-    return captures
-
-def get_king_moves(self, piece):
-    moves = {}
-    directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]  # 4 diagonal directions
-    row, col = piece.row, piece.col
-
-    for dr, dc in directions:
-        r, c = row + dr, col + dc
-        has_captured = False
-        skipped = []
-
-        while 0 <= r < 8 and 0 <= c < 8:
-            current = self.board[r][c]
-
-            if current == 0:
-                if has_captured:
-                    moves[(r, c)] = skipped
-                r += dr
-                c += dc
-
-            elif current.color != piece.color:
-                if not has_captured:
-                    skipped = [current]
-                    has_captured = True
-                    r += dr
-                    c += dc
-                else:
-                    break  # can't capture two in one direction
-
-            else:
-                break  # blocked by same color
-
-    return moves
-
-def get_piece_captures(board, row, col, piece, enemy):
-    captures = []  # Will hold tuples of landing squares where captures happen
-
-    directions = []
-    if piece in (1, 2):  # Normal pawn: define directions
-        # Example: black pawns move down, white pawns move up
-        directions = [(-1, -1), (-1, 1)] if piece == 1 else [(1, -1), (1, 1)]
-    elif piece in (3, 4):  # King: moves diagonally any distance
-        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-
-    for dr, dc in directions:
-        r, c = row + dr, col + dc
-
-        if piece in (1, 2):  # Normal pawn capture check
-            # Check adjacent diagonal for enemy and next diagonal for empty
-            r2, c2 = row + 2*dr, col + 2*dc
-            if 0 <= r < ROWS and 0 <= c < COLS and board[r][c] in enemy:
-                if 0 <= r2 < ROWS and 0 <= c2 < COLS and board[r2][c2] == 0:
-                    captures.append((r2, c2))
-
-        elif piece in (3, 4):  # King capture (multi-step)
-            # Move along diagonal until enemy found, then check next for empty
-            steps = 1
-            while True:
-                r = row + dr*steps
-                c = col + dc*steps
-                if not (0 <= r < ROWS and 0 <= c < COLS):
-                    break
-                if board[r][c] == 0:
-                    steps += 1
-                    continue
-                elif board[r][c] in enemy:
-                    r2 = r + dr
-                    c2 = c + dc
-                    if 0 <= r2 < ROWS and 0 <= c2 < COLS and board[r2][c2] == 0:
-                        captures.append((r2, c2))
-                    break
-                else:
-                    break
-    return captures
-
-
-def main():
-    board = create_board()
+def main(profile_path=None, workers=None, variant=CLASSIC):
+    from ai import Searcher
+    from book import Book
+    from notation import board_to_fen
+    from parallel import ParallelSearcher
+    from profiling import Profiler, write_report
+    from records import UNFINISHED, append_game
+    from tablebase import Tablebase
+    from worker import SearchWorker
+
+    set_board_size(variant.size)
+    init_display()
+    board = create_board(variant)
     selected = None
     valid_move_positions = {}
+    pending = None
     turn = None
     start_message = ""
     game_started = False
     game_over = False
     winner = None
+    computer = None
+    history = []
+    start_fen = None
+    saved = True
+    tablebase = Tablebase(TABLEBASE) if os.path.exists(TABLEBASE) else None
+    book = Book(BOOK) if os.path.exists(BOOK) else None
+    workers = AI_WORKERS if workers is None else workers
+    if workers > 1:
+        searcher = ParallelSearcher(workers, time_limit=AI_TIME, tablebase=tablebase, book=book)
+    else:
+        searcher = Searcher(time_limit=AI_TIME, tablebase=tablebase, book=book)
+    worker = SearchWorker(searcher)
+    frame_timer = FrameTimer()
+    renderer = Renderer(WIN)
+    show_frame_time = False
+    # Rules instrumentation runs while its overlay is shown (F4), or for the
+    # whole session with --profile
+    profiler = Profiler()
+    if profile_path:
+        profiler.start()
+    show_profile = False
+    profile_lines = []
     clock = pygame.time.Clock()
+    # Hand the GIL back to this loop quickly while the search thread runs
+    sys.setswitchinterval(0.001)
 
     button_width = 140
     button_start_x = (WIDTH - (button_width * 3 + BUTTON_SPACING * 2)) // 2
@@ -375,46 +297,113 @@ def main():
         Button(button_start_x, BUTTON_Y, button_width, BUTTON_HEIGHT, "Red First", (255, 0, 0), (179, 1, 1)),
         Button(button_start_x + button_width + BUTTON_SPACING, BUTTON_Y, button_width, BUTTON_HEIGHT, "White First", (218, 218, 218), (169, 169, 169)),
         Button(button_start_x + 2 * (button_width + BUTTON_SPACING), BUTTON_Y, button_width, BUTTON_HEIGHT, "Random", (78, 255, 70), (34, 139, 34)),
+        Button((WIDTH - 170) // 2, BUTTON_Y + BUTTON_HEIGHT + 20, button_width, BUTTON_HEIGHT, "vs Computer", BUTTON_BG, BUTTON_HOVER),
     ]
 
-    def check_game_over():
-        for player in (1, 2):
-            pieces = [(r, c) for r in range(ROWS) for c in range(COLS) if board[r][c] in (player, player + 2)]
-            if not pieces:
-                return 2 if player == 1 else 1
-            moves_exist = any(valid_moves(board, r, c) for r, c in pieces)
-            if not moves_exist:
-                return 2 if player == 1 else 1
-        return None
+    def moves_from(r, c):
+        return {dest: caps for (frm, dest), caps in legal_moves(board, turn, pending).items() if frm == (r, c)}
+
+    def save_game(result):
+        # The archive holds classic games only (its moves are 8x8 squares)
+        nonlocal saved
+        if history and not saved and variant is CLASSIC:
+            append_game(GAMES_FILE, {"result": result, "fen": start_fen, "moves": list(history)})
+        saved = True
 
     run = True
     while run:
         clock.tick(60)
-        WIN.fill(BEIGE)
-        draw_board(WIN)
-        draw_pieces(WIN, board, selected)
-
-        for (r, c) in valid_move_positions:
-            pygame.draw.rect(WIN, (0, 255, 255), (BOARD_OFFSET_X + c * SQUARE_SIZE, BOARD_OFFSET_Y + r * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE), 3)
-
+        frame_start = time.perf_counter()
+        overlays = []
         if not game_started:
-            for btn in buttons:
-                btn.draw(WIN)
+            mouse_pos = pygame.mouse.get_pos()
+            overlays += [btn.overlay(mouse_pos) for btn in buttons]
         if start_message:
-            msg_surface = font.render(start_message, True, BLACK)
-            WIN.blit(msg_surface, (WIDTH // 2 - msg_surface.get_width() // 2, BUTTON_Y - 40))
+            msg_surface = renderer.text(start_message)
+            msg_rect = msg_surface.get_rect(topleft=(WIDTH // 2 - msg_surface.get_width() // 2, BUTTON_Y - 40))
+            overlays.append((("text", start_message), msg_surface, msg_rect))
         else:
             if game_over:
                 msg = f"Game Over! {'Red' if winner == 1 else 'White'} wins!"
-                text_surface = font.render(msg, True, BLACK)
-                WIN.blit(text_surface, text_surface.get_rect(center=(WIDTH // 2, HEIGHT // 2)))
-
-        pygame.display.update()
+                text_surface = renderer.text(msg)
+                overlays.append((("text", msg), text_surface, text_surface.get_rect(center=(WIDTH // 2, HEIGHT // 2))))
+        if show_frame_time:
+            timer_text = frame_timer.text(clock)
+            timer_surface = renderer.text(timer_text, small=True, background=BEIGE)
+            overlays.append((("timer", timer_text), timer_surface, timer_surface.get_rect(bottomleft=(5, HEIGHT - 5))))
+        if show_profile:
+            # Refreshed twice a second so the text stays readable
+            if profiler.frame_count % 30 == 0 or not profile_lines:
+                profile_lines = profiler.overlay_lines()
+            for i, line in enumerate(profile_lines):
+                line_surface = renderer.text(line, small=True, background=BEIGE)
+                overlays.append((("profile", i, line), line_surface, line_surface.get_rect(topleft=(5, 5 + 18 * i))))
+
+        # Nothing is drawn or flipped while the picture is unchanged
+        renderer.draw(board, selected, valid_move_positions, overlays)
+
+        # Computer's turn: the search runs on the worker thread, the move is
+        # played on the first frame after its result arrives
+        if game_started and not game_over and turn == computer:
+            if not worker.busy:
+                worker.start(board, turn, pending)
+            result = worker.poll()
+            if result:
+                best, stats = result
+                if "error" in stats:
+                    if workers <= 1:
+                        raise stats["error"]
+                    # The search processes failed: from the next frame on the
+                    # computer searches in this process
+                    searcher.close()
+                    workers = 1
+                    searcher = Searcher(time_limit=AI_TIME, tablebase=tablebase, book=book)
+                    worker = SearchWorker(searcher)
+                    pygame.display.set_caption("Checkers - search processes failed, searching here")
+                else:
+                    if stats["book"]:
+                        pygame.display.set_caption("Checkers - book move")
+                    else:
+                        pygame.display.set_caption(f"Checkers - depth {stats['depth']}, {stats['nps']:,.0f} nodes/s")
+                    if best:
+                        history.append(best)
+                        turn, pending = play_move(board, turn, *best)
+                    # A jump that continues after crowning is not the end of the turn
+                    winner = check_game_over(board) if pending is None else None
+                    if winner:
+                        game_over = True
+                        save_game(winner)
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 run = False
 
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                renderer.invalidate()
+
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_F3:
+                    show_frame_time = not show_frame_time
+                elif event.key == pygame.K_F4:
+                    show_profile = not show_profile
+                    profile_lines = []
+                    if show_profile:
+                        profiler.start()
+                    elif not profile_path:
+                        profiler.stop()
+                elif event.key == pygame.K_n:
+                    # New game: stop any search and go back to the start buttons
+                    worker.cancel()
+                    save_game(UNFINISHED)
+                    game_started = False
+                    game_over = False
+                    winner = None
+                    start_message = ""
+                    selected = None
+                    valid_move_positions = {}
+                    pending = None
+                    board = create_board(variant)
+
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 pos = pygame.mouse.get_pos()
 
@@ -422,27 +411,38 @@ def main():
                     # Check which start button clicked
                     for idx, btn in enumerate(buttons):
                         if btn.is_clicked(pos):
+                            computer = None
                             if idx == 0:
                                 turn = 1
                             elif idx == 1:
                                 turn = 2
-                            else:
+                            elif idx == 2:
                                 turn = random.choice([1, 2])
                                 start_message = "Red starts first!" if turn == 1 else "White starts first!"
+                            else:
+                                turn = 1
+                                computer = 2
+                                start_message = "You play Red vs the computer!"
+                                # The search processes start while Red thinks
+                                worker.prepare()
                             game_started = True
                             selected = None
                             valid_move_positions = {}
+                            pending = None
                             game_over = False
                             winner = None
-                            board = create_board()
+                            board = create_board(variant)
+                            history = []
+                            start_fen = None if turn == 1 else board_to_fen(board, turn)
+                            saved = False
                             break
                 else:
                     # Clear start_message on first player interaction
                     if start_message:
                         start_message = ""
 
-                    if game_over:
-                        continue  # Ignore clicks after game ended
+                    if game_over or turn == computer:
+                        continue  # Ignore clicks after game ended or while the computer moves
 
                     clicked = get_row_col_from_mouse(pos)
                     if clicked:
@@ -453,12 +453,8 @@ def main():
                         # If selecting own piece
                         if selected is None:
                             if piece in (turn, turn + 2):
-                                # Enforce mandatory capture
-                                player_pieces = [(rr, cc) for rr in range(ROWS) for cc in range(COLS) if board[rr][cc] in (turn, turn + 2)]
-                                capture_available = any(any(valid_moves(board, rr, cc)[dest] for dest in valid_moves(board, rr, cc)) for rr, cc in player_pieces)
-                                moves = valid_moves(board, r, c)
-                                if capture_available:
-                                    moves = {k: v for k, v in moves.items() if v}  # filter only capturing moves
+                                # legal_moves enforces mandatory capture
+                                moves = moves_from(r, c)
                                 if moves:
                                     selected = (r, c)
                                     valid_move_positions = moves
@@ -470,40 +466,28 @@ def main():
                             # Move attempt if clicking on valid move square
                             if (r, c) in valid_move_positions:
                                 captured = valid_move_positions[(r, c)]
-                                move(board, selected[0], selected[1], r, c, captured)
-
-                                # Check for additional jumps if capture happened
-                                if captured:
-                                    new_captures = valid_moves(board, r, c)
-                                    # Filter to only capturing moves
-                                    new_captures = {k: v for k, v in new_captures.items() if v}
-                                    if new_captures:
-                                        selected = (r, c)
-                                        valid_move_positions = new_captures
-                                    else:
-                                        # End turn
-                                        turn = 2 if turn == 1 else 1
-                                        selected = None
-                                        valid_move_positions = {}
+                                history.append((selected, (r, c), captured))
+                                undo = move(board, selected[0], selected[1], r, c, captured)
+
+                                # A capture that crowns may go on with the same piece
+                                turn, pending = next_turn(board, turn, (r, c), captured, undo[0])
+                                if pending:
+                                    selected = (r, c)
+                                    valid_move_positions = moves_from(r, c)
                                 else:
-                                    # No capture move, end turn
-                                    turn = 2 if turn == 1 else 1
                                     selected = None
                                     valid_move_positions = {}
 
                                 # Check game over after move
-                                winner = check_game_over()
+                                winner = check_game_over(board) if pending is None else None
                                 if winner:
                                     game_over = True
+                                    save_game(winner)
 
                             else:
                                 # Clicking on another piece resets selection
                                 if piece in (turn, turn + 2):
-                                    moves = valid_moves(board, r, c)
-                                    player_pieces = [(rr, cc) for rr in range(ROWS) for cc in range(COLS) if board[rr][cc] in (turn, turn + 2)]
-                                    capture_available = any(any(valid_moves(board, rr, cc)[dest] for dest in valid_moves(board, rr, cc)) for rr, cc in player_pieces)
-                                    if capture_available:
-                                        moves = {k: v for k, v in moves.items() if v}
+                                    moves = moves_from(r, c)
                                     if moves:
                                         selected = (r, c)
                                         valid_move_positions = moves
@@ -514,8 +498,81 @@ def main():
                                     selected = None
                                     valid_move_positions = {}
 
+        frame_ms = (time.perf_counter() - frame_start) * 1000
+        frame_timer.add(frame_ms)
+        if profiler.running:
+            profiler.frame(frame_ms)
+
+    worker.cancel()
+    if workers > 1:
+        searcher.close()
+    save_game(UNFINISHED)
+    profiler.stop()
+    if profile_path:
+        write_report(profiler.report(), profile_path)
+    pygame.quit()
+    sys.exit()
+
+def replay_viewer(path, index=0):
+    # Steps through one recorded game: Right or Space forward, Left back,
+    # Home and End jump to either end
+    from records import RESULTS, read_games, replay, start_position
+
+    with open(path, "rb") as f:
+        for i, game in enumerate(read_games(f)):
+            if i == index:
+                break
+        else:
+            raise SystemExit(f"{path} has no game {index + 1}")
+    init_display()
+    board, _ = start_position(game)
+    frames = [(copy_board(board), None)]
+    for board, _, _, mv in replay(game):
+        frames.append((copy_board(board), mv))
+
+    pygame.display.set_caption(f"Checkers - replay of game {index + 1}")
+    renderer = Renderer(WIN)
+    clock = pygame.time.Clock()
+    ply = 0
+    run = True
+    while run:
+        clock.tick(60)
+        shown, mv = frames[ply]
+        label = f"ply {ply}/{len(frames) - 1}  result {RESULTS[game['result']]}"
+        label_surface = renderer.text(label, small=True, background=BEIGE)
+        overlays = [(("text", label), label_surface, label_surface.get_rect(bottomleft=(5, HEIGHT - 5)))]
+        # The last move is shown as a selection from its start square
+        renderer.draw(shown, mv[0] if mv else None, {mv[1]: mv[2]} if mv else {}, overlays)
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                run = False
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                renderer.invalidate()
+            elif event.type == pygame.KEYDOWN:
+                if event.key in (pygame.K_RIGHT, pygame.K_SPACE):
+                    ply = min(ply + 1, len(frames) - 1)
+                elif event.key == pygame.K_LEFT:
+                    ply = max(ply - 1, 0)
+                elif event.key == pygame.K_HOME:
+                    ply = 0
+                elif event.key == pygame.K_END:
+                    ply = len(frames) - 1
+
     pygame.quit()
     sys.exit()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Checkers")
+    parser.add_argument("--replay", metavar="ARCHIVE", help="step through a recorded game instead of playing")
+    parser.add_argument("--game", type=int, default=1, help="game number in the archive, from 1")
+    parser.add_argument("--workers", type=int, help=f"search processes for the computer (default {AI_WORKERS})")
+    parser.add_argument("--variant", choices=list(VARIANTS), default=CLASSIC.name,
+                        help="rules to play by (only classic games are recorded)")
+    parser.add_argument("--profile", metavar="FILE", help="count rules calls for the session and write them "
+                        "to FILE at exit (.prom for Prometheus text, else JSON)")
+    args = parser.parse_args()
+    if args.replay:
+        replay_viewer(args.replay, args.game - 1)
+    else:
+        main(args.profile, args.workers, get_variant(args.variant))
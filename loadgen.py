@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from bitboard import RC_TO_SQ, SQ_TO_RC, from_board, side_moves
+from server import raise_file_limit
+
+# Load generator for server.py: plays many concurrent games of random legal
+# moves over real connections and reports how long the server takes to
+# confirm each move.
+#
+#   python loadgen.py --games 1000 --spawn
+#
+# Each game is two clients. A client keeps its board up to date from the
+# server's deltas, thinks for a random time, then sends a move; the latency
+# is the time until the server's broadcast of that move comes back. Games
+# are resigned after --max-plies; with --reconnect some clients drop their
+# connection now and then and resume the game with their token.
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.endings = Counter()
+        self.errors = Counter()
+        self.reconnects = 0
+
+
+def send(writer, msg):
+    writer.write(json.dumps(msg).encode() + b"\n")
+
+
+async def client(host, port, opening, args, rng, stats, seated=None):
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 16)
+    send(writer, opening)
+    board = turn = pending = game = side = token = None
+    ply = 0
+    sent_at = None
+    resigned = False
+    while True:
+        line = await reader.readline()
+        if not line:
+            stats.errors["connection closed"] += 1
+            break
+        msg = json.loads(line)
+        kind = msg["type"]
+        if kind == "seated":
+            game, side, token = msg["game"], msg["side"], msg["token"]
+            if seated is not None:
+                seated.set_result(game)
+                seated = None
+            continue
+        if kind == "state":
+            board, turn, pending, ply = msg["board"], msg["turn"], msg["pending"], msg["ply"]
+            if msg["result"] is not None:
+                # Resumed a game that ended meanwhile
+                if side == 1:
+                    stats.endings[msg["reason"]] += 1
+                break
+        elif kind == "move":
+            for r, c, piece in msg["changes"]:
+                board[r][c] = piece
+            turn, pending, ply = msg["turn"], msg["pending"], msg["ply"]
+            if msg["side"] == side and sent_at is not None:
+                stats.latencies.append(time.perf_counter() - sent_at)
+                sent_at = None
+        elif kind == "over":
+            if side == 1:
+                stats.endings[msg["reason"]] += 1
+            break
+        elif kind == "error":
+            stats.errors[msg["reason"]] += 1
+            sent_at = None
+            continue
+
+        if board is None or turn != side or sent_at is not None or resigned:
+            continue
+        if ply >= args.max_plies:
+            send(writer, {"type": "resign"})
+            resigned = True
+            continue
+        await asyncio.sleep(rng.uniform(0, 2 * args.think))
+        if args.reconnect and rng.random() < args.reconnect:
+            # Drop the connection and pick the game up again; the server
+            # answers with the full state
+            writer.close()
+            reader, writer = await asyncio.open_connection(host, port, limit=1 << 16)
+            send(writer, {"type": "resume", "game": game, "token": token})
+            stats.reconnects += 1
+            continue
+        moves = side_moves(from_board(board), side, RC_TO_SQ[tuple(pending)] if pending else None)
+        if not moves:
+            continue  # the game is over; the server says so next
+        frm, to, _ = rng.choice(moves)
+        frm, to = SQ_TO_RC[frm], SQ_TO_RC[to]
+        sent_at = time.perf_counter()
+        send(writer, {"type": "move", "from": frm, "to": to})
+    writer.close()
+
+
+async def play_game(host, port, args, rng, stats):
+    seated = asyncio.get_running_loop().create_future()
+    first = asyncio.create_task(client(host, port, {"type": "new", "side": 1}, args, rng, stats, seated))
+    game = await seated
+    await asyncio.gather(first, client(host, port, {"type": "join", "game": game}, args, rng, stats))
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    stats = Stats()
+    start = time.perf_counter()
+    await asyncio.gather(*(play_game(args.host, args.port, args, random.Random(rng.random()), stats)
+                           for _ in range(args.games)))
+    return stats, time.perf_counter() - start
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-games load test for server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--games", type=int, default=500, help="games played at the same time")
+    parser.add_argument("--max-plies", type=int, default=60, help="the side to move resigns after this many plies")
+    parser.add_argument("--think", type=float, default=0.05, help="mean seconds before each move")
+    parser.add_argument("--reconnect", type=float, default=0.01, help="chance to reconnect before a move")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--spawn", action="store_true", help="start a server for the run")
+    args = parser.parse_args(argv)
+
+    raise_file_limit()
+    server = None
+    if args.spawn:
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+        server = subprocess.Popen([sys.executable, script, "--host", args.host, "--port", str(args.port),
+                                   "--engine-workers", "0"], stderr=subprocess.PIPE, text=True)
+        server.stderr.readline()  # "serving on ..."
+    try:
+        stats, elapsed = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    lat = [s * 1000 for s in stats.latencies]
+    endings = ", ".join(f"{reason} {count}" for reason, count in stats.endings.most_common())
+    print(f"{args.games} concurrent games in {elapsed:.1f}s ({endings})")
+    print(f"{len(lat)} moves, {len(lat) / elapsed:,.0f} moves/s, {stats.reconnects} reconnects")
+    print(f"move latency p50 {percentile(lat, 50):.2f} ms  p99 {percentile(lat, 99):.2f} ms  max {max(lat, default=0):.2f} ms")
+    if stats.errors:
+        print("errors: " + ", ".join(f"{reason} {count}" for reason, count in stats.errors.items()))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
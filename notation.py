@@ -0,0 +1,57 @@
+from rules import CLASSIC, ROWS, Board, variant_of
+
+# Positions as PDN-style FEN text: side to move, then the White and Black
+# piece lists, e.g. "B:W21,22,K30:B1-3,K9". Red plays the Black side.
+# Squares are numbered row by row from the top-left, Red's home row: 1-32
+# on 8x8, where square 1 is (0, 1) and square 32 is (7, 6), and 1-50 on
+# 10x10.
+
+SIDE_LETTER = {1: "B", 2: "W"}
+LETTER_SIDE = {"B": 1, "W": 2}
+
+
+def square_number(row, col, size=ROWS):
+    return row * (size // 2) + col // 2 + 1
+
+
+def square_rc(number, size=ROWS):
+    if not 1 <= number <= size * size // 2:
+        raise ValueError(f"no square {number}")
+    row, i = divmod(number - 1, size // 2)
+    return row, 2 * i + 1 - row % 2
+
+
+def board_to_fen(board, player):
+    pieces = {1: [], 2: []}
+    for sq, (r, c) in enumerate(variant_of(board).squares):
+        piece = board[r][c]
+        if piece:
+            side = 1 if piece in (1, 3) else 2
+            pieces[side].append(("K" if piece in (3, 4) else "") + str(sq + 1))
+    return f"{SIDE_LETTER[player]}:W{','.join(pieces[2])}:B{','.join(pieces[1])}"
+
+
+def fen_to_board(text, variant=CLASSIC):
+    # Returns (board, player to move); raises ValueError on bad input
+    fields = text.strip().strip('"').rstrip(".").split(":")
+    if len(fields) != 3 or fields[0].upper() not in LETTER_SIDE:
+        raise ValueError(f"bad FEN: {text!r}")
+    board = [[0 for _ in range(variant.size)] for _ in range(variant.size)]
+    for field in fields[1:]:
+        field = field.strip()
+        if not field or field[0].upper() not in LETTER_SIDE:
+            raise ValueError(f"bad piece list in FEN: {text!r}")
+        side = LETTER_SIDE[field[0].upper()]
+        for item in filter(None, (part.strip() for part in field[1:].split(","))):
+            king = item[0].upper() == "K"
+            if king:
+                item = item[1:]
+            first, _, last = item.partition("-")
+            try:
+                numbers = range(int(first), int(last or first) + 1)
+            except ValueError:
+                raise ValueError(f"bad square {item!r} in FEN: {text!r}") from None
+            for number in numbers:
+                r, c = square_rc(number, variant.size)
+                board[r][c] = side + 2 if king else side
+    return Board(board, variant), LETTER_SIDE[fields[0].upper()]
@@ -0,0 +1,426 @@
+import argparse
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from ai import MATE, MAX_PLY, SearchTimeout, Searcher, TranspositionTable, piece_count
+from rules import (MAX_SIZE, POOL_LEGAL_CACHE_SIZE, check_game_over, copy_board, create_board, legal_moves, play_move,
+                   set_legal_cache_size)
+
+# Parallel search: the root moves of every iterative-deepening step are
+# shared out to worker processes, which search them with one transposition
+# table kept in shared memory, so what one worker finds the others reuse.
+#
+#   python parallel.py --workers 8 --depth 8      # speedup from 1 to 8 workers
+#   python parallel.py --workers 4 --deterministic
+#
+# The best root move of the previous depth is searched first, on its own;
+# the others then go out in parallel with its value as alpha, and every
+# finished move raises alpha for the moves handed out after it. Timing
+# decides which move sees which alpha and what the table holds, so among
+# equally good moves the one returned can change from run to run. With
+# deterministic=True every root move gets a full window and an empty
+# private table, and ties go to the earlier move in legal_moves() order:
+# at a fixed depth the result then depends only on the position, for any
+# number of workers. That costs speed; it is meant for tests.
+
+# Moves are stored as two dark-square numbers of the largest board, six
+# bits each, so every variant's squares fit
+SQUARES = [(r, c) for r in range(MAX_SIZE) for c in range(MAX_SIZE) if (r + c) % 2 != 0]
+SQUARE_INDEX = {rc: i for i, rc in enumerate(SQUARES)}
+NO_MOVE = 4095
+
+
+class SharedTable:
+    # TranspositionTable in shared memory. A slot is two 64-bit words: the
+    # entry packed into one, and the key xor that word in the other. Workers
+    # write without locks; a slot torn by two writers at once no longer
+    # matches its key and reads as empty.
+    def __init__(self, size=1 << 18, name=None):
+        if size & (size - 1):
+            raise ValueError("transposition table size must be a power of two")
+        from multiprocessing import shared_memory
+
+        self.mask = size - 1
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=16 * size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.words = self.shm.buf.cast("Q")
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def clear(self):
+        self.shm.buf[:] = bytes(len(self.shm.buf))
+
+    def close(self):
+        self.words.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def probe(self, key):
+        self.probes += 1
+        i = (key & self.mask) << 1
+        data = self.words[i + 1]
+        if data and self.words[i] ^ data == key:
+            self.hits += 1
+            mv = data >> 42 & 0xFFF
+            best = None if mv == NO_MOVE else (SQUARES[mv & 63], SQUARES[mv >> 6])
+            return key, (data >> 32 & 0xFF) - 128, (data & 0xFFFFFFFF) - (1 << 31), data >> 40 & 3, best, data >> 54 & 0xFF
+        return None
+
+    def store(self, key, depth, value, flag, best):
+        i = (key & self.mask) << 1
+        generation = self.generation & 0xFF
+        old = self.words[i + 1]
+        if (old and self.words[i] ^ old != key and old >> 54 & 0xFF == generation
+                and depth < (old >> 32 & 0xFF) - 128):
+            return
+        mv = NO_MOVE if best is None else SQUARE_INDEX[best[0]] | SQUARE_INDEX[best[1]] << 6
+        data = (1 << 63 | generation << 54 | mv << 42 | flag << 40
+                | (max(-128, min(depth, 127)) + 128) << 32 | (value + (1 << 31)))
+        self.words[i] = key ^ data
+        self.words[i + 1] = data
+
+
+def _worker(tasks, results, halt, table_name, tt_size, weights, tablebase_path):
+    set_legal_cache_size(POOL_LEGAL_CACHE_SIZE)
+    table = SharedTable(tt_size, name=table_name)
+    tablebase = None
+    if tablebase_path:
+        from tablebase import Tablebase
+        tablebase = Tablebase(tablebase_path)
+    searcher = Searcher(time_limit=None, weights=weights, tablebase=tablebase, tt=table)
+    private = None
+    last_generation = None
+    results.put(None)  # ready
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        index, board, player, (frm, to, caps), depth, alpha, beta, seconds, generation, deterministic = task
+        if deterministic:
+            if private is None:
+                private = TranspositionTable(tt_size)
+            private.clear()
+            searcher.tt = private
+            searcher.history = {}
+            searcher.killers = [[None, None] for _ in range(MAX_PLY)]
+        else:
+            searcher.tt = table
+            table.generation = generation
+            if generation != last_generation:
+                last_generation = generation
+                for mv in searcher.history:
+                    searcher.history[mv] //= 2
+                searcher.killers = [[None, None] for _ in range(MAX_PLY)]
+        probes, hits = searcher.tt.probes, searcher.tt.hits
+        deadline = None if seconds is None else time.perf_counter() + seconds
+        searcher.nodes = searcher.tb_hits = 0
+        try:
+            if halt.is_set():
+                raise SearchTimeout
+            value = searcher.search_root_move(board, player, frm, to, caps, depth, alpha, beta, deadline, halt)
+        except SearchTimeout:
+            value = None
+        results.put((index, value, searcher.nodes, searcher.tb_hits,
+                     searcher.tt.probes - probes, searcher.tt.hits - hits))
+    table.close()
+
+
+class ParallelSearcher:
+    # Stands in for Searcher: the same search(), stats() and attributes,
+    # with each search spread over worker processes. The workers start with
+    # the first search that needs them, or earlier with start(), and stay
+    # until close().
+    def __init__(self, workers=None, time_limit=1.0, max_depth=64, tt_size=1 << 18, weights=None, tablebase=None,
+                 book=None, deterministic=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.tt_size = tt_size
+        self.weights = weights
+        self.tablebase = tablebase
+        self.book = book
+        self.deterministic = deterministic
+        self.procs = []
+        self.table = None
+        self.generation = 0
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.elapsed = 0.0
+        self.tb_hits = 0
+        self.book_hit = False
+        self.probes = 0
+        self.hits = 0
+        self.starting = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def nps(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    def stats(self):
+        return {
+            "nodes": self.nodes,
+            "depth": self.depth,
+            "score": self.score,
+            "elapsed": self.elapsed,
+            "nps": self.nps,
+            "tt_hit_rate": self.hits / self.probes if self.probes else 0.0,
+            "tb_hits": self.tb_hits,
+            "book": self.book_hit,
+            "workers": self.workers,
+        }
+
+    def start(self, stop=None):
+        # Starts the workers unless they are running; True once they are
+        # ready. stop is an optional threading.Event: once it is set the
+        # workers started so far are shut down and False is returned.
+        while not self.starting.acquire(timeout=0.01):
+            if stop is not None and stop.is_set():
+                return False
+        try:
+            if self.procs:
+                return True
+            import multiprocessing
+
+            # Spawned, not forked: the game forks badly with pygame and a
+            # search thread running
+            ctx = multiprocessing.get_context("spawn")
+            self.table = SharedTable(self.tt_size)
+            self.tasks = ctx.Queue()
+            self.results = ctx.Queue()
+            self.halt = ctx.Event()
+            path = self.tablebase.path if self.tablebase is not None else None
+            for _ in range(self.workers):
+                proc = ctx.Process(target=_worker, daemon=True,
+                                   args=(self.tasks, self.results, self.halt, self.table.name, self.tt_size,
+                                         self.weights, path))
+                proc.start()
+                self.procs.append(proc)
+            ready = 0
+            while ready < len(self.procs):
+                if stop is not None and stop.is_set():
+                    self._shutdown(wait=False)
+                    return False
+                try:
+                    self.results.get(timeout=0.01)
+                    ready += 1
+                except queue.Empty:
+                    if not all(proc.is_alive() for proc in self.procs):
+                        self._shutdown(wait=False)
+                        raise RuntimeError("a search worker died") from None
+            return True
+        finally:
+            self.starting.release()
+
+    def close(self):
+        with self.starting:
+            self._shutdown(wait=True)
+
+    def _shutdown(self, wait):
+        # Asks the workers to finish (or, without wait, just ends them) and
+        # frees the shared table
+        if self.table is None:
+            return
+        if wait:
+            for _ in self.procs:
+                self.tasks.put(None)
+        for proc in self.procs:
+            if wait:
+                proc.join(5)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+        self.procs = []
+        self.table.close()
+        self.table = None
+
+    def search(self, board, player, pending=None, time_limit=None, max_depth=None, stop=None):
+        # Best (from, to, captured) for player, or None if there is no move.
+        # stop is an optional threading.Event that ends the search early.
+        # Starting the workers, if start() was not called beforehand, counts
+        # against the time limit and is ended by stop as well.
+        start = time.perf_counter()
+        limit = self.time_limit if time_limit is None else time_limit
+        max_depth = self.max_depth if max_depth is None else max_depth
+        deadline = start + limit if limit else None
+        self.nodes = self.depth = self.score = self.tb_hits = 0
+        self.probes = self.hits = 0
+        self.book_hit = False
+
+        moves = legal_moves(board, player, pending)
+        if not moves:
+            self.elapsed = time.perf_counter() - start
+            return None
+        root = [(frm, to, caps) for (frm, to), caps in moves.items()]
+        best = root[0]
+
+        if self.book is not None and pending is None:
+            choice = self.book.choose(board, player)
+            if choice is not None:
+                self.book_hit = True
+                self.elapsed = time.perf_counter() - start
+                return choice
+
+        if self.tablebase is not None and piece_count(board) <= self.tablebase.max_pieces:
+            answer = self.tablebase.best_move(board, player, pending)
+            if answer is not None:
+                best, (result, distance) = answer
+                self.tb_hits = 1
+                self.score = (MATE - distance if result > 0 else distance - MATE) if result else 0
+                self.elapsed = time.perf_counter() - start
+                return best
+
+        if len(root) > 1:
+            if not self.start(stop):
+                self.elapsed = time.perf_counter() - start
+                return best
+            self.generation += 1
+            self.halt.clear()
+            position = copy_board(board)  # goes to the workers with its variant and key
+            order = list(range(len(root)))
+            for depth in range(1, max_depth + 1):
+                values = self._iteration(position, player, root, order, depth, deadline, stop)
+                if values is None:
+                    break
+                # Fail-low values are only bounds; the best exact one wins
+                index = max((i for i, (_, exact) in values.items() if exact), key=lambda i: (values[i][0], -i))
+                best, self.score, self.depth = root[index], values[index][0], depth
+                order.sort(key=lambda i: (i != index, -values[i][0]))
+                if abs(self.score) >= MATE - MAX_PLY:
+                    break
+        self.elapsed = time.perf_counter() - start
+        return best
+
+    def _iteration(self, position, player, root, order, depth, deadline, stop):
+        # {index: (value, exact)} for every root move at depth, or None once
+        # the time is up or stop is set
+        todo = list(order)
+        sent = {}
+        values = {}
+        alpha = -MATE - 1
+        in_flight = 0
+        while len(values) < len(root):
+            while todo and in_flight < self.workers and (self.deterministic or values or not in_flight):
+                index = todo.pop(0)
+                sent[index] = -MATE - 1 if self.deterministic else alpha
+                seconds = None if deadline is None else max(deadline - time.perf_counter(), 0.0)
+                self.tasks.put((index, position, player, root[index], depth, sent[index], MATE + 1, seconds,
+                                self.generation, self.deterministic))
+                in_flight += 1
+            try:
+                index, value, nodes, tb_hits, probes, hits = self.results.get(timeout=0.01)
+            except queue.Empty:
+                if (deadline and time.perf_counter() > deadline) or (stop is not None and stop.is_set()):
+                    self._abort(in_flight)
+                    return None
+                if not all(proc.is_alive() for proc in self.procs):
+                    raise RuntimeError("a search worker died")
+                continue
+            in_flight -= 1
+            self._count(nodes, tb_hits, probes, hits)
+            if value is None:
+                self._abort(in_flight)
+                return None
+            values[index] = (value, value > sent[index])
+            alpha = max(alpha, value)
+        return values
+
+    def _count(self, nodes, tb_hits, probes, hits):
+        self.nodes += nodes
+        self.tb_hits += tb_hits
+        self.probes += probes
+        self.hits += hits
+
+    def _abort(self, in_flight):
+        # Stops the workers and waits for the moves still out, so nothing
+        # from this search is left in the queues
+        self.halt.set()
+        for _ in range(in_flight):
+            _, _, nodes, tb_hits, probes, hits = self.results.get()
+            self._count(nodes, tb_hits, probes, hits)
+
+
+def sample_positions(count, seed, plies=10):
+    # Positions after a few random moves from the start, for the report
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board, player, pending = create_board(), 1, None
+        for _ in range(plies):
+            moves = legal_moves(board, player, pending)
+            if not moves:
+                break
+            (frm, to), caps = rng.choice(list(moves.items()))
+            player, pending = play_move(board, player, frm, to, caps)
+        if pending is None and not check_game_over(board) and len(legal_moves(board, player)) > 1:
+            positions.append((board, player))
+    return positions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Speedup of the parallel search from 1 to N workers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="largest worker count")
+    parser.add_argument("--depth", type=int, default=7)
+    parser.add_argument("--positions", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--deterministic", action="store_true", help="also check every worker count agrees")
+    args = parser.parse_args(argv)
+
+    positions = sample_positions(args.positions, args.seed)
+    counts = sorted({1, args.workers} | {n for n in (2, 4, 8, 16, 32, 64) if n < args.workers})
+    print(f"{len(positions)} positions, depth {args.depth}, {os.cpu_count()} CPUs"
+          f"{', deterministic' if args.deterministic else ''}")
+    searcher = Searcher(time_limit=None, max_depth=args.depth)
+    nodes = 0
+    start = time.perf_counter()
+    for board, player in positions:
+        searcher.search(board, player)
+        nodes += searcher.nodes
+    elapsed = time.perf_counter() - start
+    print(f" serial   {elapsed:8.2f}s {nodes:12,} nodes {nodes / elapsed:10,.0f} nodes/s  (Searcher, one process)")
+
+    base = None
+    answers = []
+    for workers in counts:
+        with ParallelSearcher(workers, time_limit=None, max_depth=args.depth, deterministic=args.deterministic) as searcher:
+            searcher.start()
+            nodes = 0
+            found = []
+            start = time.perf_counter()
+            for board, player in positions:
+                found.append((searcher.search(board, player), searcher.score))
+                nodes += searcher.nodes
+            elapsed = time.perf_counter() - start
+        base = base or elapsed
+        answers.append(found)
+        print(f"{workers:3d} workers {elapsed:8.2f}s {nodes:12,} nodes {nodes / elapsed:10,.0f} nodes/s  "
+              f"speedup {base / elapsed:5.2f}x")
+    if args.deterministic:
+        if any(found != answers[0] for found in answers):
+            print("worker counts disagree", file=sys.stderr)
+            return 1
+        print("same moves and scores for every worker count")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
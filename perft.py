@@ -0,0 +1,149 @@
+import argparse
+import sys
+import time
+
+import bitboard
+from notation import fen_to_board, square_number
+from rules import CLASSIC, VARIANTS, check_game_over, get_variant, legal_moves, move, next_turn, unmove
+
+# Perft: counts the leaf nodes of the game tree to a fixed depth, so rule
+# changes and optimizations can be checked for speed and for correctness.
+# One node is one entry of legal_moves(); a jump that continues after
+# crowning is its own ply for the same side. Finished games are not
+# expanded.
+#
+#   python perft.py                      # reference suite
+#   python perft.py --fen "B:W...:B..." --depth 4 --divide
+#   python perft.py --backend bitboard
+#   python perft.py --variant english
+
+
+START_FEN = "B:W21-32:B1-12"
+
+# name, variant, FEN, leaf counts for depth 1, 2, 3, ... The English start
+# counts are the published ones.
+REFERENCE = [
+    ("start", "classic", START_FEN, [7, 49, 302, 1469, 7473, 37628, 187302]),
+    ("flying king multi-capture", "classic", "W:WK29,32:BK1,6,8,9,22,27", [2, 10, 24, 172, 1173, 9447, 67982]),
+    ("promotion during capture", "classic", "B:W18,27,31:B3,23", [2, 6, 18, 80, 223, 886, 2138, 8664, 18442]),
+    ("max-capture ties", "classic", "B:W7,14,16,23,24,25,30:B2,9,12", [2, 3, 7, 27, 76, 292, 780, 2967]),
+    ("king endgame", "classic", "W:WK4,K29:BK1,K32,12", [12, 104, 1039, 10667, 108023]),
+    ("start", "english", START_FEN, [7, 49, 302, 1469, 7361, 36768, 179740]),
+]
+
+
+def perft(board, player, pending, depth):
+    if pending is None and check_game_over(board):
+        return 0
+    moves = legal_moves(board, player, pending)
+    if depth == 1:
+        return len(moves)
+    total = 0
+    for (frm, to), caps in moves.items():
+        undo = move(board, frm[0], frm[1], to[0], to[1], caps)
+        total += perft(board, *next_turn(board, player, to, caps, undo[0]), depth - 1)
+        unmove(board, frm[0], frm[1], to[0], to[1], caps, undo)
+    return total
+
+
+def perft_bitboard(pos, player, pending, depth):
+    if pending is None and bitboard.winner(pos):
+        return 0
+    moves = bitboard.side_moves(pos, player, pending)
+    if depth == 1:
+        return len(moves)
+    total = 0
+    other = 2 if player == 1 else 1
+    for frm, to, caps in moves:
+        child = bitboard.make_move(pos, frm, to, caps)
+        if caps and bitboard.piece_captures(child, to):
+            total += perft_bitboard(child, player, to, depth - 1)
+        else:
+            total += perft_bitboard(child, other, None, depth - 1)
+    return total
+
+
+def root_moves(board, player, backend):
+    # (label, count function) for every root move, used by divide mode
+    if backend == "bitboard":
+        pos = bitboard.from_board(board)
+        for frm, to, caps in bitboard.side_moves(pos, player):
+            child = bitboard.make_move(pos, frm, to, caps)
+            label = f"{frm + 1}{'x' if caps else '-'}{to + 1}"
+            turn = (player, to) if caps and bitboard.piece_captures(child, to) else (3 - player, None)
+            yield label, lambda depth, child=child, turn=turn: perft_bitboard(child, *turn, depth) if depth else 1
+        return
+    for (frm, to), caps in list(legal_moves(board, player).items()):
+        size = len(board)
+        label = f"{square_number(*frm, size)}{'x' if caps else '-'}{square_number(*to, size)}"
+
+        def count(depth, frm=frm, to=to, caps=caps):
+            undo = move(board, frm[0], frm[1], to[0], to[1], caps)
+            total = perft(board, *next_turn(board, player, to, caps, undo[0]), depth) if depth else 1
+            unmove(board, frm[0], frm[1], to[0], to[1], caps, undo)
+            return total
+
+        yield label, count
+
+
+def run(board, player, depth, backend):
+    if depth == 0:
+        return 1
+    if backend == "bitboard":
+        return perft_bitboard(bitboard.from_board(board), player, None, depth)
+    return perft(board, player, None, depth)
+
+
+def timed(board, player, depth, backend):
+    start = time.perf_counter()
+    nodes = run(board, player, depth, backend)
+    return nodes, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft node counts for the rules engine")
+    parser.add_argument("--fen", help="position to count instead of the reference suite")
+    parser.add_argument("--depth", type=int, help="maximum depth (default: all reference depths, or 4 with --fen)")
+    parser.add_argument("--divide", action="store_true", help="break the count down per root move")
+    parser.add_argument("--backend", choices=("lists", "bitboard"), default="lists")
+    parser.add_argument("--variant", choices=list(VARIANTS), help="rules for --fen (default classic), "
+                        "or the only ones to count in the reference suite")
+    args = parser.parse_args(argv)
+    if args.backend == "bitboard" and args.variant not in (None, CLASSIC.name):
+        parser.error("the bitboard backend plays the classic rules only")
+
+    if args.fen:
+        board, player = fen_to_board(args.fen, get_variant(args.variant or CLASSIC.name))
+        depth = args.depth or 4
+        if args.divide:
+            total = 0
+            for label, count in root_moves(board, player, args.backend):
+                nodes = count(depth - 1)
+                total += nodes
+                print(f"{label:8s} {nodes}")
+            print(f"total    {total}")
+            return 0
+        for d in range(1, depth + 1):
+            nodes, elapsed = timed(board, player, d, args.backend)
+            print(f"depth {d:2d} {nodes:12d} nodes {nodes / elapsed if elapsed else 0:12,.0f} nodes/s")
+        return 0
+
+    failed = 0
+    for name, variant, fen, counts in REFERENCE:
+        if variant != (args.variant or variant) or args.backend == "bitboard" and variant != CLASSIC.name:
+            continue
+        board, player = fen_to_board(fen, get_variant(variant))
+        print(f"{name}, {variant} ({fen})")
+        for d, expected in enumerate(counts[:args.depth], start=1):
+            nodes, elapsed = timed(board, player, d, args.backend)
+            status = "ok" if nodes == expected else f"MISMATCH, expected {expected}"
+            failed += nodes != expected
+            print(f"  depth {d:2d} {nodes:12d} nodes {nodes / elapsed if elapsed else 0:12,.0f} nodes/s  {status}")
+    if failed:
+        print(f"{failed} count(s) differ from the reference", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
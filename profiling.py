@@ -0,0 +1,268 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+import rules
+
+# Opt-in instrumentation of the rules engine. Nothing here costs anything
+# until a Profiler is started: start() swaps the hot rules functions for
+# counting wrappers in rules and in the IMPORTERS that took them by name,
+# and stop() puts the originals back, so a stopped profiler leaves the very
+# same functions in place.
+#
+#   python profiling.py --games 10 --depth 3               # JSON report
+#   python profiling.py --games 10 --format prom -o rules.prom
+#   python checkers.py --profile profile.json              # F4 in the game
+#
+# Per function the profiler keeps the number of calls and the time spent in
+# outermost calls (a recursive call is counted but not timed twice).
+# _search_captures calls are the nodes of the capture search, and the
+# longest chain it has walked is kept too; copy_board calls are the board
+# copies. The legal-move cache statistics come from legal_cache_stats() and
+# cover the whole process. Times are wall-clock. Only this process is
+# counted: in the game that covers the computer's search with --workers 1,
+# which runs on a thread here, but not the searches of parallel.py worker
+# processes. frame() is called once per UI frame and keeps what each of
+# the last frames cost.
+
+HOT_FUNCTIONS = (
+    "legal_moves", "_generate_legal_moves", "valid_moves", "_capture_moves", "_quiet_moves",
+    "explore_captures", "_search_captures", "check_game_over", "any_capture_available",
+    "copy_board", "hash_board", "move", "unmove",
+)
+
+# Modules that run in a profiled process and take rules functions by name
+# ("from rules import ..."); __main__ is checkers.py run as a script
+IMPORTERS = ("rules", "ai", "book", "parallel", "worker", "checkers", "__main__")
+
+
+def _replace(name, old, new):
+    # Points name at new wherever it is bound to old in the IMPORTERS
+    for module_name in IMPORTERS:
+        module = sys.modules.get(module_name)
+        if module is not None and getattr(module, name, None) is old:
+            setattr(module, name, new)
+
+
+class Profiler:
+    def __init__(self, functions=HOT_FUNCTIONS, frames=60):
+        self.functions = functions
+        self.counts = {name: [0, 0] for name in functions}  # calls, ns
+        self.max_chain = 0
+        self.wrappers = {}
+        self.elapsed_ns = 0
+        self.started_ns = None
+        self.frames = deque(maxlen=frames)  # (frame ms, {name: (calls, ns)})
+        self.frame_count = 0
+        self.frame_ms_total = 0.0
+        self.frame_ms_max = 0.0
+        self.last_counts = None
+
+    @property
+    def running(self):
+        return self.started_ns is not None
+
+    def start(self):
+        if self.running:
+            return
+        for name in self.functions:
+            original = getattr(rules, name)
+            wrapper = self._wrap(name, original)
+            self.wrappers[name] = (original, wrapper)
+            _replace(name, original, wrapper)
+        self.last_counts = None
+        self.started_ns = time.perf_counter_ns()
+
+    def stop(self):
+        if not self.running:
+            return
+        for name, (original, wrapper) in self.wrappers.items():
+            _replace(name, wrapper, original)
+        self.wrappers = {}
+        self.elapsed_ns += time.perf_counter_ns() - self.started_ns
+        self.started_ns = None
+
+    def _wrap(self, name, func):
+        counts = self.counts[name]
+        clock = time.perf_counter_ns
+        chain = name == "_search_captures"
+        # Whether an outermost call is running, per thread: the UI and the
+        # search thread may both be inside the same function
+        local = threading.local()
+
+        def wrapper(*args, **kwargs):
+            counts[0] += 1
+            if chain and len(args[7]) > self.max_chain:
+                self.max_chain = len(args[7])  # pieces captured so far
+            if getattr(local, "active", False):
+                return func(*args, **kwargs)
+            local.active = True
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                counts[1] += clock() - start
+                local.active = False
+
+        wrapper.__name__ = func.__name__
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def frame(self, frame_ms):
+        # Records one UI frame that took frame_ms to handle and draw
+        now = {name: (calls, ns) for name, (calls, ns) in self.counts.items()}
+        if self.last_counts is not None:
+            delta = {name: (calls - self.last_counts[name][0], ns - self.last_counts[name][1])
+                     for name, (calls, ns) in now.items()}
+            self.frames.append((frame_ms, delta))
+            self.frame_count += 1
+            self.frame_ms_total += frame_ms
+            self.frame_ms_max = max(self.frame_ms_max, frame_ms)
+        self.last_counts = now
+
+    def per_frame(self):
+        # {name: (calls, ms)} averaged over the last frames
+        if not self.frames:
+            return {}
+        n = len(self.frames)
+        totals = {name: [0, 0] for name in self.functions}
+        for _, delta in self.frames:
+            for name, (calls, ns) in delta.items():
+                totals[name][0] += calls
+                totals[name][1] += ns
+        return {name: (calls / n, ns / n / 1e6) for name, (calls, ns) in totals.items()}
+
+    def overlay_lines(self, top=6):
+        # Short text lines for the in-game overlay, costliest functions first
+        window = self.per_frame()
+        frame_ms = sum(ms for ms, _ in self.frames) / len(self.frames) if self.frames else 0.0
+        lines = [f"rules per frame (last {len(self.frames)}), frame {frame_ms:.2f} ms"]
+        busy = sorted(((ms, calls, name) for name, (calls, ms) in window.items() if calls), reverse=True)
+        for ms, calls, name in busy[:top]:
+            lines.append(f"{name} {calls:,.1f} calls {ms:.3f} ms")
+        lines.append(f"capture nodes {self.counts['_search_captures'][0]:,}  chain {self.max_chain}  "
+                     f"copies {self.counts['copy_board'][0]:,}  "
+                     f"cache hits {rules.legal_cache_stats()['hit_rate']:.0%}")
+        return lines
+
+    def report(self):
+        # Everything counted so far, as plain data for json.dumps()
+        elapsed = self.elapsed_ns + (time.perf_counter_ns() - self.started_ns if self.running else 0)
+        functions = {}
+        for name, (calls, ns) in self.counts.items():
+            functions[name] = {"calls": calls, "seconds": ns / 1e9, "us_per_call": ns / calls / 1000 if calls else 0.0}
+        window = self.per_frame()
+        return {
+            "elapsed_seconds": elapsed / 1e9,
+            "functions": functions,
+            "capture_nodes": self.counts["_search_captures"][0],
+            "max_capture_chain": self.max_chain,
+            "board_copies": self.counts["copy_board"][0],
+            "legal_cache": rules.legal_cache_stats(),
+            "frames": {
+                "count": self.frame_count,
+                "avg_ms": self.frame_ms_total / self.frame_count if self.frame_count else 0.0,
+                "max_ms": self.frame_ms_max,
+                "recent_per_frame": {name: {"calls": calls, "ms": ms} for name, (calls, ms) in window.items()},
+            },
+        }
+
+
+def to_prometheus(report, prefix="checkers"):
+    # Prometheus text exposition format
+    lines = []
+
+    def metric(name, kind, text, samples):
+        lines.append(f"# HELP {prefix}_{name} {text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for labels, value in samples:
+            label = "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}" if labels else ""
+            lines.append(f"{prefix}_{name}{label} {value if isinstance(value, int) else format(value, '.6g')}")
+
+    functions = report["functions"]
+    metric("rules_calls_total", "counter", "Calls per rules function",
+           [({"function": name}, f["calls"]) for name, f in functions.items()])
+    metric("rules_seconds_total", "counter", "Time spent in outermost calls per rules function",
+           [({"function": name}, f["seconds"]) for name, f in functions.items()])
+    metric("capture_nodes_total", "counter", "Nodes of the capture search", [({}, report["capture_nodes"])])
+    metric("capture_chain_max", "gauge", "Longest capture chain searched", [({}, report["max_capture_chain"])])
+    metric("board_copies_total", "counter", "Boards copied", [({}, report["board_copies"])])
+    cache = report["legal_cache"]
+    metric("legal_cache_lookups_total", "counter", "Legal-move cache lookups",
+           [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])])
+    metric("legal_cache_evictions_total", "counter", "Legal-move cache entries dropped", [({}, cache["evictions"])])
+    metric("legal_cache_entries", "gauge", "Legal-move cache entries held", [({}, cache["entries"])])
+    frames = report["frames"]
+    metric("frames_total", "counter", "UI frames recorded", [({}, frames["count"])])
+    metric("frame_milliseconds", "gauge", "UI frame time", [({"stat": "avg"}, frames["avg_ms"]),
+                                                            ({"stat": "max"}, frames["max_ms"])])
+    return "\n".join(lines) + "\n"
+
+
+def write_report(report, path, fmt=None):
+    # fmt is "json" or "prom"; by default Prometheus text for a .prom or
+    # .txt path and JSON otherwise. "-" is stdout.
+    if fmt is None:
+        fmt = "prom" if path.endswith((".prom", ".txt")) else "json"
+    if fmt == "prom":
+        text = to_prometheus(report)
+    else:
+        text = json.dumps(report, indent=2) + "\n"
+    if path == "-":
+        sys.stdout.write(text)
+    else:
+        with open(path, "w") as f:
+            f.write(text)
+
+
+def play_games(games, depth, seed):
+    # Headless workload: the engine at a fixed depth against itself, with a
+    # few random opening moves per game
+    from ai import Searcher
+
+    rng = random.Random(seed)
+    searcher = Searcher(time_limit=1e9, max_depth=depth, tt_size=1 << 16)
+    plies = 0
+    for _ in range(games):
+        board, player, pending = rules.create_board(), 1, None
+        for ply in range(200):
+            if pending is None and rules.check_game_over(board):
+                break
+            if ply < 4:
+                (frm, to), caps = rng.choice(list(rules.legal_moves(board, player, pending).items()))
+                best = (frm, to, caps)
+            else:
+                best = searcher.search(board, player, pending)
+            player, pending = rules.play_move(board, player, *best)
+            plies += 1
+    return plies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the rules engine on engine self-play")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=3, help="engine search depth")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=("json", "prom"), help="default: from the file name, else json")
+    parser.add_argument("--out", "-o", default="-", help="report file, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    profiler = Profiler()
+    profiler.start()
+    try:
+        plies = play_games(args.games, args.depth, args.seed)
+    finally:
+        profiler.stop()
+    report = profiler.report()
+    report["plies"] = plies
+    write_report(report, args.out, args.format)
+    print(f"{args.games} games, {plies} plies in {report['elapsed_seconds']:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
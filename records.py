@@ -0,0 +1,238 @@
+import argparse
+import json
+import sys
+import time
+
+from bitboard import RC_TO_SQ, SQ_TO_RC
+from notation import board_to_fen, fen_to_board
+from rules import create_board, legal_moves, play_move
+
+# Compact binary game archives, read and written as streams so that very
+# large files never have to fit in memory, plus PDN text export.
+#
+#   python records.py convert selfplay.jsonl games.ckg
+#   python records.py pdn games.ckg --out games.pdn
+#   python records.py check games.ckg
+#
+# A file starts with MAGIC, then holds one block per game:
+#   varint   length of the rest of the block in bytes
+#   byte     result (see RESULTS)
+#   byte     flags; bit 0: a start position follows (varint length + FEN)
+#   varint   number of plies
+#   per ply  uint16 little-endian: from square | to square << 5 |
+#            number of captured pieces << 10, then one byte per captured
+#            square, in jump order
+# Squares are 0-31 as in bitboard.py. A quiet move takes 2 bytes, a single
+# jump 3. A game is a dict: {"result", "fen" (None for the usual start with
+# Red to move), "moves": [(from, to, captured), ...]} with (row, col)
+# squares, the same arguments play_move() takes.
+
+MAGIC = b"CKGR\x01"
+DRAW, RED_WIN, WHITE_WIN, UNFINISHED = 0, 1, 2, 3
+RESULTS = {DRAW: "1-1", RED_WIN: "2-0", WHITE_WIN: "0-2", UNFINISHED: "*"}
+HAS_FEN = 1
+
+
+def _varint(n):
+    out = bytearray()
+    while n > 0x7F:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _read_varint(data, i):
+    n = shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, i
+        shift += 7
+
+
+def encode_game(game):
+    body = bytearray([game.get("result", DRAW), HAS_FEN if game.get("fen") else 0])
+    if game.get("fen"):
+        fen = game["fen"].encode("ascii")
+        body += _varint(len(fen)) + fen
+    body += _varint(len(game["moves"]))
+    for frm, to, caps in game["moves"]:
+        word = RC_TO_SQ[tuple(frm)] | RC_TO_SQ[tuple(to)] << 5 | len(caps) << 10
+        body += word.to_bytes(2, "little")
+        body += bytes(RC_TO_SQ[tuple(c)] for c in caps)
+    return _varint(len(body)) + bytes(body)
+
+
+def decode_game(body):
+    result, flags = body[0], body[1]
+    i = 2
+    fen = None
+    if flags & HAS_FEN:
+        length, i = _read_varint(body, i)
+        fen = body[i:i + length].decode("ascii")
+        i += length
+    count, i = _read_varint(body, i)
+    moves = []
+    for _ in range(count):
+        word = body[i] | body[i + 1] << 8
+        ncaps = word >> 10
+        caps = [SQ_TO_RC[sq] for sq in body[i + 2:i + 2 + ncaps]]
+        moves.append((SQ_TO_RC[word & 31], SQ_TO_RC[word >> 5 & 31], caps))
+        i += 2 + ncaps
+    return {"result": result, "fen": fen, "moves": moves}
+
+
+def write_games(f, games):
+    # Appends games from any iterable to a binary file opened "wb" or "ab"
+    if f.tell() == 0:
+        f.write(MAGIC)
+    count = 0
+    for game in games:
+        f.write(encode_game(game))
+        count += 1
+    return count
+
+
+def read_games(f):
+    # Yields games one at a time from a binary file
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not a game archive")
+    while True:
+        head = f.read(1)
+        if not head:
+            return
+        length = shift = 0
+        while True:
+            byte = head[0]
+            length |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+            head = f.read(1)
+        body = f.read(length)
+        if len(body) != length:
+            raise ValueError("truncated game archive")
+        yield decode_game(body)
+
+
+def append_game(path, game):
+    with open(path, "ab") as f:
+        write_games(f, [game])
+
+
+def start_position(game):
+    if game.get("fen"):
+        return fen_to_board(game["fen"])
+    return create_board(), 1
+
+
+def replay(game, check=False):
+    # Plays a game through the rules, yielding (board, player, pending,
+    # move) after every ply. The same board object is updated in place.
+    board, player = start_position(game)
+    pending = None
+    for frm, to, caps in game["moves"]:
+        if check and list(caps) != legal_moves(board, player, pending).get((frm, to)):
+            raise ValueError(f"illegal move {frm}-{to} for player {player}")
+        player, pending = play_move(board, player, frm, to, caps)
+        yield board, player, pending, (frm, to, caps)
+
+
+def to_pdn(game, tags=None):
+    # PDN text; a jump that continues after crowning joins the same move
+    board, player = start_position(game)
+    headers = dict(tags or {})
+    headers["Result"] = RESULTS[game["result"]]
+    if game.get("fen"):
+        headers["SetUp"] = "1"
+        headers["FEN"] = board_to_fen(board, player)
+    turns = []
+    continuing = False
+    mover = player
+    for _, nxt, pending, (frm, to, caps) in replay(game):
+        if continuing:
+            turns[-1] = (mover, f"{turns[-1][1]}x{RC_TO_SQ[to] + 1}")
+        else:
+            turns.append((mover, f"{RC_TO_SQ[frm] + 1}{'x' if caps else '-'}{RC_TO_SQ[to] + 1}"))
+        continuing = pending is not None
+        mover = nxt
+
+    # Red (Black in PDN) moves carry the move number
+    words = []
+    number = 1
+    for i, (mover, text) in enumerate(turns):
+        if mover == 1:
+            words.append(f"{number}. {text}")
+        else:
+            words.append(f"{number}... {text}" if i == 0 else text)
+            number += 1
+    words.append(headers["Result"])
+
+    lines = [f'[{key} "{value}"]' for key, value in headers.items()]
+    lines.append("")
+    line = ""
+    for word in words:
+        if line and len(line) + len(word) >= 80:
+            lines.append(line)
+            line = ""
+        line = f"{line} {word}" if line else word
+    lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def from_record(rec):
+    # Game from one selfplay.py record
+    moves = [((m[0], m[1]), (m[2], m[3]), [tuple(c) for c in m[4]]) for m in rec["moves"]]
+    return {"result": rec["result"], "fen": None, "moves": moves}
+
+
+def from_selfplay(f):
+    # Games from a selfplay.py JSONL file
+    for line in f:
+        yield from_record(json.loads(line))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert, export and check binary game archives")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="selfplay JSONL to a binary archive")
+    convert.add_argument("jsonl")
+    convert.add_argument("archive")
+    pdn = sub.add_parser("pdn", help="export an archive as PDN")
+    pdn.add_argument("archive")
+    pdn.add_argument("--out", "-o", default="-")
+    check = sub.add_parser("check", help="replay every game through the rules")
+    check.add_argument("archive")
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        with open(args.jsonl) as src, open(args.archive, "ab") as dst:
+            count = write_games(dst, from_selfplay(src))
+        print(f"{count} games appended to {args.archive}")
+    elif args.command == "pdn":
+        out = sys.stdout if args.out == "-" else open(args.out, "w")
+        with open(args.archive, "rb") as f:
+            for i, game in enumerate(read_games(f)):
+                out.write(to_pdn(game, {"Event": f"Game {i + 1}"}) + "\n")
+        if out is not sys.stdout:
+            out.close()
+    else:
+        games = plies = 0
+        start = time.perf_counter()
+        with open(args.archive, "rb") as f:
+            for game in read_games(f):
+                for _ in replay(game, check=True):
+                    plies += 1
+                games += 1
+            size = f.tell()
+        elapsed = time.perf_counter() - start
+        print(f"{games} games, {plies} plies, {size / max(plies, 1):.2f} bytes/ply, "
+              f"{plies / elapsed if elapsed else 0:,.0f} plies/s replayed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
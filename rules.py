@@ -0,0 +1,476 @@
+import random
+from collections import OrderedDict
+
+# Size of the default board; a variant may use any even size up to MAX_SIZE
+ROWS, COLS = 8, 8
+MAX_SIZE = 10
+
+DIRECTIONS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+ENEMIES = {1: (2, 4), 2: (1, 3), 3: (2, 4), 4: (1, 3)}
+FORWARD = {1: (2, 3), 2: (0, 1)}  # indexes into DIRECTIONS: Red moves down, White up
+CROWNINGS = ("end", "continue", "immediate")
+
+# Stands on a square whose piece has been jumped while a capture is still
+# going on, for variants that only lift captured pieces at its end: it
+# blocks the way and cannot be jumped again.
+JUMPED = 5
+
+class Variant:
+    # One set of rules. crowning is what a man that reaches the far row by a
+    # capture does: "end" - it is crowned only if the capture ends there, and
+    # the move is over; "continue" - crowned at the end of its capture, it
+    # keeps capturing as a king in the same turn; "immediate" - it is crowned
+    # on reaching the row and goes on capturing as a king. The new king's
+    # jumps are a continuation of the turn (see next_turn()), searched once
+    # the pieces jumped so far have been lifted. With remove_at_end jumped
+    # pieces stay on the board until the capture is over.
+    #
+    # The squares every piece can jump and move to are worked out once per
+    # square, on first use, so move generation follows tables instead of
+    # checking the board edges on every step.
+    def __init__(self, name, size=8, men_rows=3, flying_kings=True, men_capture_backward=True,
+                 max_capture=True, crowning="continue", remove_at_end=False):
+        if size % 2 or not 4 <= size <= MAX_SIZE or not 0 < men_rows < size // 2:
+            raise ValueError(f"bad board for variant {name!r}: size {size}, {men_rows} rows of men")
+        if crowning not in CROWNINGS:
+            raise ValueError(f"crowning must be one of {', '.join(CROWNINGS)}")
+        self.name = name
+        self.size = size
+        self.men_rows = men_rows
+        self.flying_kings = flying_kings
+        self.men_capture_backward = men_capture_backward
+        self.max_capture = max_capture
+        self.crowning = crowning
+        self.remove_at_end = remove_at_end
+        # A capture that crowns a man may go on with the new king
+        self.continues = crowning != "end"
+        self.jumped = JUMPED if remove_at_end else 0
+        # Classic positions keep the Zobrist keys they always had
+        self.key = 0 if name == "classic" else random.Random(name).getrandbits(64)
+        self.squares = [(r, c) for r in range(size) for c in range(size) if (r + c) % 2 != 0]
+        self.crown_row = {1: size - 1, 2: 0}
+
+    def __getattr__(self, name):
+        # jumps[piece][row][col]: one tuple per direction the piece captures
+        # in, of (square, landing squares) for every square the piece to jump
+        # may stand on. steps[piece][row][col]: per direction, the squares the
+        # piece may move to.
+        if name not in ("jumps", "steps"):
+            raise AttributeError(name)
+        size = range(self.size)
+        self.jumps = [[[self._jumps(piece, r, c) for c in size] for r in size] for piece in range(5)]
+        self.steps = [[[self._steps(piece, r, c) for c in size] for r in size] for piece in range(5)]
+        return getattr(self, name)
+
+    def __repr__(self):
+        return f"Variant({self.name!r})"
+
+    def __reduce_ex__(self, protocol):
+        # The presets travel between processes by name
+        if VARIANTS.get(self.name) is self:
+            return get_variant, (self.name,)
+        return super().__reduce_ex__(protocol)
+
+    def _ray(self, row, col, d):
+        dr, dc = DIRECTIONS[d]
+        squares = []
+        r, c = row + dr, col + dc
+        while 0 <= r < self.size and 0 <= c < self.size:
+            squares.append((r, c))
+            r += dr
+            c += dc
+        return squares
+
+    def _jumps(self, piece, row, col):
+        if not piece or piece in (1, 2) and self.crowning == "immediate" and row == self.crown_row[piece]:
+            return ()
+        king = piece in (3, 4)
+        directions = range(4) if king or self.men_capture_backward else FORWARD[piece]
+        rays = []
+        for d in directions:
+            ray = self._ray(row, col, d)
+            if len(ray) < 2:
+                continue
+            if king and self.flying_kings:
+                rays.append(tuple((square, tuple(ray[i + 1:])) for i, square in enumerate(ray[:-1])))
+            else:
+                rays.append(((ray[0], (ray[1],)),))
+        return tuple(rays)
+
+    def _steps(self, piece, row, col):
+        if not piece:
+            return ()
+        king = piece in (3, 4)
+        rays = []
+        for d in (range(4) if king else FORWARD[piece]):
+            ray = self._ray(row, col, d)
+            if ray:
+                rays.append(tuple(ray if king and self.flying_kings else ray[:1]))
+        return tuple(rays)
+
+
+# The rules this game has always played: flying kings, men capturing
+# backwards, only the longest captures, and a man crowned by a capture goes
+# on capturing as a king.
+#
+# Russian and international rules are not here yet: a move is known by its
+# (from, to) squares, so two captures between the same squares that take
+# different pieces - common on 10x10, where pieces are lifted at the end -
+# count as one, and a Russian man crowned mid-capture should keep capturing
+# in the same chain, over pieces not yet lifted, which next_turn() cannot
+# express. Variant(size=10, ...) still builds such boards for experiments.
+CLASSIC = Variant("classic")
+VARIANTS = {
+    "classic": CLASSIC,
+    "english": Variant("english", flying_kings=False, men_capture_backward=False, max_capture=False,
+                       crowning="end", remove_at_end=True),
+    "brazilian": Variant("brazilian", crowning="end", remove_at_end=True),
+}
+# The rules a plain list of rows is played by, from its size
+SIZE_DEFAULTS = {8: CLASSIC}
+
+def get_variant(name):
+    try:
+        return VARIANTS[name]
+    except KeyError:
+        raise ValueError(f"unknown variant {name!r} (one of {', '.join(VARIANTS)})") from None
+
+def variant_of(board):
+    return board.variant if isinstance(board, Board) else SIZE_DEFAULTS[len(board)]
+
+def create_board(variant=CLASSIC):
+    size = variant.size
+    board = [[0 for _ in range(size)] for _ in range(size)]
+    for row, col in variant.squares:
+        if row < variant.men_rows:
+            board[row][col] = 1
+        elif row >= size - variant.men_rows:
+            board[row][col] = 2
+    return Board(board, variant)
+
+# Zobrist keys: one 64-bit value per square and piece type (index 0 is the
+# empty square and hashes to 0), plus one for White to move. Fixed seed so
+# keys are the same in every process and run. A position's key also holds
+# the key of its variant (0 for the classic rules).
+_zobrist_rng = random.Random(0x5EED)
+ZOBRIST = [[[0] + [_zobrist_rng.getrandbits(64) for _ in range(4)] for _ in range(COLS)] for _ in range(ROWS)]
+ZOBRIST_SIDE = _zobrist_rng.getrandbits(64)
+# Squares of larger boards, drawn after the others so 8x8 keys never change
+for _row in ZOBRIST:
+    _row.extend([0] + [_zobrist_rng.getrandbits(64) for _ in range(4)] for _ in range(MAX_SIZE - COLS))
+ZOBRIST.extend([[0] + [_zobrist_rng.getrandbits(64) for _ in range(4)] for _ in range(MAX_SIZE)]
+               for _ in range(MAX_SIZE - ROWS))
+
+class Board(list):
+    # Rows of a board, the variant it is played by, and its Zobrist key,
+    # kept up to date by move() and king_if_needed(); change a Board only
+    # through those.
+    def __init__(self, rows=(), variant=None):
+        super().__init__(rows)
+        self.variant = variant or SIZE_DEFAULTS[len(self)]
+        self.key = hash_board(self)
+
+def copy_board(board):
+    new_board = Board.__new__(Board)
+    new_board.extend(row.copy() for row in board)
+    new_board.variant = variant_of(board)
+    new_board.key = board.key if isinstance(board, Board) else hash_board(board)
+    return new_board
+
+def hash_board(board, player=None):
+    key = variant_of(board).key ^ (ZOBRIST_SIDE if player == 2 else 0)
+    for row, cells in enumerate(board):
+        for col, piece in enumerate(cells):
+            key ^= ZOBRIST[row][col][piece]
+    return key
+
+def position_key(board, player=None):
+    # Like hash_board() but free for a Board, whose key is already known
+    if not isinstance(board, Board):
+        return hash_board(board, player)
+    return board.key ^ ZOBRIST_SIDE if player == 2 else board.key
+
+def explore_captures(board, row, col, piece, path=None, captured=None, variant=None):
+    # Jumps are made and unmade in place on board; path and captured act as
+    # shared stacks and are only copied when a finished chain is recorded.
+    # With the max-capture rule only the longest chains are returned, else
+    # every chain that cannot go on.
+    if path is None:
+        path = [(row, col)]
+    if captured is None:
+        captured = []
+    if variant is None:
+        variant = variant_of(board)
+    longest_paths = []
+    _search_captures(board, row, col, piece, ENEMIES[piece], variant, path, captured, longest_paths)
+    return longest_paths
+
+
+def _search_captures(board, row, col, piece, enemy, variant, path, captured, longest_paths):
+    jumped = False
+    for ray in variant.jumps[piece][row][col]:
+        # Over empty squares to the first piece; only a flying king's rays
+        # hold more than one square to look at
+        for (r1, c1), landings in ray:
+            if board[r1][c1]:
+                break
+        else:
+            continue
+        if board[r1][c1] not in enemy:
+            continue
+
+        for r2, c2 in landings:
+            if board[r2][c2]:
+                break
+            jumped = True
+            origin, taken = board[row][col], board[r1][c1]
+            board[row][col] = 0
+            board[r1][c1] = variant.jumped
+            board[r2][c2] = piece
+            path.append((r2, c2))
+            captured.append((r1, c1))
+            _search_captures(board, r2, c2, piece, enemy, variant, path, captured, longest_paths)
+            path.pop()
+            captured.pop()
+            board[r2][c2] = 0
+            board[r1][c1] = taken
+            board[row][col] = origin
+
+    if not jumped:
+        if not variant.max_capture:
+            longest_paths.append((path[:], captured[:]))
+            return
+        max_length = len(longest_paths[0][1]) if longest_paths else 0
+        if len(captured) > max_length:
+            longest_paths.clear()
+        if len(captured) >= max_length:
+            longest_paths.append((path[:], captured[:]))
+
+
+class LRUCache:
+    # Bounded mapping that drops the least recently used entry when full and
+    # counts its hits, misses and evictions
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            self.entries.move_to_end(key)
+        except KeyError:
+            pass  # evicted by another thread in between
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, size):
+        self.size = size
+        while len(self.entries) > size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size,
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def _capture_moves(board, row, col, variant=None):
+    piece = board[row][col]
+    if not piece:
+        return {}
+    if variant is None:
+        variant = variant_of(board)
+
+    all_moves = {}
+
+    # 1. Explore captures first (for kings and normal pieces)
+    captures = explore_captures(board, row, col, piece, [(row, col)], [], variant)
+    if not variant.max_capture:
+        return {path[-1]: captured for path, captured in captures if captured}
+    max_capture_len = 0
+
+    for path, captured in captures:
+        capture_len = len(captured)
+        if capture_len > max_capture_len:
+            max_capture_len = capture_len
+            all_moves = {path[-1]: captured}
+        elif capture_len == max_capture_len and capture_len > 0:
+            all_moves[path[-1]] = captured
+
+    # Filter only max-length captures if any
+    if max_capture_len > 0:
+        all_moves = {move: caps for move, caps in all_moves.items() if len(caps) == max_capture_len}
+        return all_moves
+    return {}
+
+
+def _quiet_moves(board, row, col, variant=None):
+    if variant is None:
+        variant = variant_of(board)
+    all_moves = {}
+    # A man steps one square forward; a king slides as far as the variant lets it
+    for ray in variant.steps[board[row][col]][row][col]:
+        for r, c in ray:
+            if board[r][c]:
+                break
+            all_moves[(r, c)] = []
+    return all_moves
+
+
+def valid_moves(board, row, col):
+    if not board[row][col]:
+        return {}
+    # 1. Explore captures first (for kings and normal pieces)
+    # 2. No captures found, generate normal moves
+    return _capture_moves(board, row, col) or _quiet_moves(board, row, col)
+
+
+# Legal moves, capture chains included, per (position key, pending). A
+# Board's Zobrist key is kept up to date by move(), unmove() and
+# king_if_needed(), so an entry can never describe another position and a
+# move needs no invalidation: positions the search or a game comes back to
+# are answered from the cache. The least recently used entries are dropped
+# once it is full; set_legal_cache_size(0) turns it off. An entry costs
+# about 2 KB. The cache pays while it stays small: the search gains most
+# from the few positions it looks at again and again (check_game_over()
+# next to legal_moves(), the last plies of a line), and a large cache is
+# slower than none. Pool processes, one per CPU, use POOL_LEGAL_CACHE_SIZE.
+LEGAL_CACHE_SIZE = 1 << 10
+POOL_LEGAL_CACHE_SIZE = 1 << 8
+_legal_cache = LRUCache(LEGAL_CACHE_SIZE)
+
+def set_legal_cache_size(size):
+    _legal_cache.resize(size)
+
+def legal_cache_stats():
+    return _legal_cache.stats()
+
+def legal_moves(board, player, pending=None):
+    # All legal moves for player as {(from, to): captured}. Captures are
+    # mandatory; with the max-capture rule of the board's variant only the
+    # longest ones on the whole board may be played. pending is the square
+    # of a piece that must keep capturing after a jump. The result is shared
+    # with the cache; do not change it.
+    if not _legal_cache.size:
+        return _generate_legal_moves(board, player, pending)
+    key = (position_key(board, player), pending)
+    moves = _legal_cache.get(key)
+    if moves is None:
+        moves = _generate_legal_moves(board, player, pending)
+        _legal_cache.put(key, moves)
+    return moves
+
+
+def _generate_legal_moves(board, player, pending):
+    variant = variant_of(board)
+    if pending is not None:
+        row, col = pending
+        return {(pending, dest): caps for dest, caps in _capture_moves(board, row, col, variant).items()}
+
+    pieces = [(r, c) for r, c in variant.squares if board[r][c] in (player, player + 2)]
+    moves = {}
+    max_capture_len = 0
+    for r, c in pieces:
+        for dest, caps in _capture_moves(board, r, c, variant).items():
+            if len(caps) > max_capture_len and variant.max_capture:
+                max_capture_len = len(caps)
+                moves = {}
+            if len(caps) >= max_capture_len:
+                moves[((r, c), dest)] = caps
+    if moves:
+        return moves
+
+    for r, c in pieces:
+        for dest in _quiet_moves(board, r, c, variant):
+            moves[((r, c), dest)] = []
+    return moves
+
+
+def check_game_over(board):
+    # Winner (1 or 2) once a side has no pieces or no legal moves, else None
+    for player in (1, 2):
+        if not legal_moves(board, player):
+            return 2 if player == 1 else 1
+    return None
+
+
+def move(board, from_row, from_col, to_row, to_col, captured_positions):
+    # Returns what unmove() needs to take the move back
+    piece = board[from_row][from_col]
+    old_key = getattr(board, "key", None)
+    board[from_row][from_col] = 0
+    board[to_row][to_col] = piece
+    key = ZOBRIST[from_row][from_col][piece] ^ ZOBRIST[to_row][to_col][piece]
+
+    taken = []
+    for r, c in captured_positions:
+        taken.append(board[r][c])
+        key ^= ZOBRIST[r][c][board[r][c]]
+        board[r][c] = 0
+
+    if isinstance(board, Board):
+        board.key ^= key
+    king_if_needed(board, to_row, to_col)
+    return piece, taken, old_key
+
+
+def unmove(board, from_row, from_col, to_row, to_col, captured_positions, undo):
+    piece, taken, old_key = undo
+    board[to_row][to_col] = 0
+    board[from_row][from_col] = piece
+    for (r, c), p in zip(captured_positions, taken):
+        board[r][c] = p
+    if isinstance(board, Board):
+        board.key = old_key
+
+
+def play_move(board, player, frm, to, captured):
+    # Plays one move and returns (player to move, pending)
+    undo = move(board, frm[0], frm[1], to[0], to[1], captured)
+    return next_turn(board, player, to, captured, undo[0])
+
+
+def next_turn(board, player, to, captured, piece):
+    # A capture that crowned the piece (piece is what moved) and left it
+    # with more jumps keeps the turn, in variants where a new king goes on
+    # capturing; the piece on to must then continue capturing.
+    if (captured and board[to[0]][to[1]] != piece and variant_of(board).continues
+            and legal_moves(board, player, to)):
+        return player, to
+    return (2 if player == 1 else 1), None
+
+
+def any_capture_available(board, player):
+    return any(caps for caps in legal_moves(board, player).values())
+
+def king_if_needed(board, row, col):
+    piece = board[row][col]
+    if piece == 1 and row == len(board) - 1:
+        board[row][col] = 3
+    elif piece == 2 and row == 0:
+        board[row][col] = 4
+    else:
+        return
+    if isinstance(board, Board):
+        board.key ^= ZOBRIST[row][col][piece] ^ ZOBRIST[row][col][piece + 2]
@@ -0,0 +1,177 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from ai import Searcher, evaluate
+from records import from_record, write_games
+from rules import (POOL_LEGAL_CACHE_SIZE, check_game_over, copy_board, create_board, legal_moves, play_move,
+                   set_legal_cache_size)
+
+# Headless self-play: plays games between two players across a process
+# pool and streams one JSON line per game. Only the rules and the search
+# are imported, never pygame.
+#
+#   python selfplay.py alphabeta:3 greedy --games 1000 --out games.jsonl
+#
+# An --out name ending in .ckg writes a binary archive (see records.py)
+# instead of JSON lines.
+#
+# Player specs: "random", "greedy" or "alphabeta:<depth>", optionally with
+# evaluation weights, e.g. "alphabeta:4:king=250,advance=5".
+
+
+def parse_player(spec):
+    name, _, rest = spec.partition(":")
+    if name in ("random", "greedy") and not rest:
+        return {"kind": name}
+    if name == "alphabeta":
+        depth, _, weights = rest.partition(":")
+        player = {"kind": name, "depth": int(depth or 4), "weights": {}}
+        for item in filter(None, weights.split(",")):
+            key, _, value = item.partition("=")
+            player["weights"][key] = int(value)
+        return player
+    raise ValueError(f"unknown player spec: {spec!r}")
+
+
+def make_chooser(player, rng):
+    # Returns choose(board, side, pending) -> (from, to, captured)
+    if player["kind"] == "random":
+        def choose(board, side, pending):
+            (frm, to), caps = rng.choice(list(legal_moves(board, side, pending).items()))
+            return frm, to, caps
+    elif player["kind"] == "greedy":
+        def choose(board, side, pending):
+            best, best_score = [], None
+            for (frm, to), caps in legal_moves(board, side, pending).items():
+                child = copy_board(board)
+                play_move(child, side, frm, to, caps)
+                score = evaluate(child, side)
+                if best_score is None or score > best_score:
+                    best, best_score = [], score
+                if score == best_score:
+                    best.append((frm, to, caps))
+            return rng.choice(best)
+    else:
+        searcher = Searcher(time_limit=0, max_depth=player["depth"], tt_size=1 << 16, weights=player["weights"])
+
+        def choose(board, side, pending):
+            return searcher.search(board, side, pending)
+    return choose
+
+
+def play_game(index, red_spec, white_spec, seed, max_plies, random_plies):
+    # One game; returns the record written to the JSONL file
+    rng = random.Random(seed)
+    choosers = {1: make_chooser(parse_player(red_spec), rng), 2: make_chooser(parse_player(white_spec), rng)}
+    board = create_board()
+    player, pending = 1, None
+    moves = []
+    winner = None
+    start = time.perf_counter()
+    while len(moves) < max_plies:
+        if pending is None:
+            winner = check_game_over(board)
+            if winner:
+                break
+        if len(moves) < random_plies:
+            (frm, to), caps = rng.choice(list(legal_moves(board, player, pending).items()))
+        else:
+            frm, to, caps = choosers[player](board, player, pending)
+        moves.append([frm[0], frm[1], to[0], to[1], [list(c) for c in caps]])
+        player, pending = play_move(board, player, frm, to, caps)
+    else:
+        winner = check_game_over(board) if pending is None else None
+    return {
+        "game": index,
+        "red": red_spec,
+        "white": white_spec,
+        "seed": seed,
+        "result": winner or 0,
+        "plies": len(moves),
+        "seconds": round(time.perf_counter() - start, 4),
+        "moves": moves,
+    }
+
+
+def wilson(successes, n, z=1.96):
+    # 95% Wilson score interval for a proportion
+    if n == 0:
+        return 0.0, 0.0
+    p = successes / n
+    centre = p + z * z / (2 * n)
+    spread = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    denom = 1 + z * z / n
+    return (centre - spread) / denom, (centre + spread) / denom
+
+
+def summarize(records, player_a, player_b, elapsed):
+    # Wins are counted by seat, not by spec, so that both players of a
+    # mirror match get their own row. Seat A plays Red in even games.
+    wins = {"a": 0, "b": 0}
+    draws = 0
+    for rec in records:
+        if rec["result"] == 0:
+            draws += 1
+        else:
+            a_red = rec["game"] % 2 == 0
+            wins["a" if (rec["result"] == 1) == a_red else "b"] += 1
+    n = len(records)
+    lines = [f"{n} games in {elapsed:.1f}s ({n / elapsed if elapsed else 0:.1f} games/s)"]
+    if not n:
+        return lines[0]
+    for label, count in ((f"A {player_a}", wins["a"]), (f"B {player_b}", wins["b"]), ("draw", draws)):
+        lo, hi = wilson(count, n)
+        lines.append(f"{label:24s} {count:6d}  {count / n:6.1%}  95% CI [{lo:.1%}, {hi:.1%}]")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless self-play between two players")
+    parser.add_argument("player_a")
+    parser.add_argument("player_b")
+    parser.add_argument("--games", "-n", type=int, default=100)
+    parser.add_argument("--workers", "-j", type=int, default=os.cpu_count())
+    parser.add_argument("--out", "-o", default="selfplay.jsonl", help="JSONL file, '-' for stdout")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-plies", type=int, default=300, help="longer games are scored as draws")
+    parser.add_argument("--random-plies", type=int, default=4, help="random opening moves for variety")
+    args = parser.parse_args(argv)
+    if args.games < 1:
+        parser.error("--games must be at least 1")
+    parse_player(args.player_a)
+    parse_player(args.player_b)
+
+    binary = args.out.endswith(".ckg")
+    out = sys.stdout if args.out == "-" else open(args.out, "wb" if binary else "w")
+    records = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=set_legal_cache_size,
+                             initargs=(POOL_LEGAL_CACHE_SIZE,)) as pool:
+        futures = []
+        for i in range(args.games):
+            # Players swap colours every game
+            red, white = (args.player_a, args.player_b) if i % 2 == 0 else (args.player_b, args.player_a)
+            futures.append(pool.submit(play_game, i, red, white, args.seed * 1000003 + i, args.max_plies, args.random_plies))
+        for future in as_completed(futures):
+            record = future.result()
+            if binary:
+                write_games(out, [from_record(record)])
+            else:
+                out.write(json.dumps(record) + "\n")
+            out.flush()
+            del record["moves"]
+            records.append(record)
+    elapsed = time.perf_counter() - start
+    if out is not sys.stdout:
+        out.close()
+    print(summarize(records, args.player_a, args.player_b, elapsed), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
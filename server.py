@@ -0,0 +1,436 @@
+import argparse
+import asyncio
+import json
+import math
+import resource
+import secrets
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from ai import Searcher
+from bitboard import RC_TO_SQ, SQ_TO_RC, initial_position, make_move, piece_captures, side_moves, to_board, winner
+from rules import POOL_LEGAL_CACHE_SIZE, Board, set_legal_cache_size
+
+# Online games over TCP: one JSON object per line in both directions. One
+# asyncio process hosts any number of games; engine opponents search in a
+# process pool so the event loop never waits on them.
+#
+#   python server.py --port 8765 --engine-workers 2
+#
+# Client messages:
+#   {"type": "new", "side": 1, "opponent": "human" | "engine", "depth": 8,
+#    "time": 1.0, "clock": 300, "increment": 2}
+#                                         depth and time limit the engine;
+#                                         clock in seconds, omit for none;
+#                                         out of LIMITS is an error
+#   {"type": "join", "game": id}          take the free seat of a game
+#   {"type": "resume", "game": id, "token": t}   reconnect to a seat
+#   {"type": "move", "from": [r, c], "to": [r, c]}
+#   {"type": "resign"}
+# Server messages:
+#   {"type": "seated", "game", "side", "token"}  keep the token to resume
+#   {"type": "state", ...}     full position, sent on start and on resume
+#   {"type": "move", "ply", "side", "from", "to", "captured", "changes",
+#    "turn", "pending", "clocks"}   changes are [row, col, piece] deltas
+#   {"type": "over", "result", "reason"}   result 1 or 2 (winner), 0 draw
+#   {"type": "error", "reason"}
+#
+# Games are kept as bitboard positions. Moves are checked against the
+# bitboard move list, which matches legal_moves(): captures are mandatory
+# and only the longest ones may be played, exactly as in the local game.
+# The legal moves are generated once when a turn starts; checking a move is
+# a dict lookup.
+#
+# A game nobody joins within JOIN_TIMEOUT, or that has nobody connected for
+# IDLE_TIMEOUT, ends as abandoned (result 0), so games never pile up.
+
+FINISHED_GRACE = 60  # seconds a finished game stays around for reconnects
+JOIN_TIMEOUT = 600  # seconds a new game waits for its opponent
+IDLE_TIMEOUT = 600  # seconds a game goes on with both players away
+# Allowed range of each setting of a new game
+LIMITS = {"clock": (0, 24 * 3600), "increment": (0, 3600), "depth": (1, 64), "time": (0.01, 60)}
+
+_searchers = {}
+
+
+def engine_move(board, player, pending, depth, time_limit):
+    # Runs in a pool process; one Searcher per setting keeps its tables warm
+    searcher = _searchers.get((depth, time_limit))
+    if searcher is None:
+        searcher = _searchers[(depth, time_limit)] = Searcher(time_limit=time_limit, max_depth=depth, tt_size=1 << 16)
+    return searcher.search(Board(board), player, tuple(pending) if pending else None)
+
+
+def raise_file_limit():
+    # Every connection is a file descriptor
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def setting(msg, key, default, convert):
+    # msg[key] converted and checked against LIMITS; raises ValueError
+    value = msg.get(key)
+    try:
+        value = convert(default if value is None else value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"bad {key}") from None
+    low, high = LIMITS[key]
+    if not (math.isfinite(value) and low <= value <= high):
+        raise ValueError(f"{key} must be between {low} and {high}")
+    return value
+
+
+def legal_table(pos, player, pending=None):
+    # {(from, to): captured} in (row, col) squares, like legal_moves()
+    if pending is not None:
+        pending = RC_TO_SQ[pending]
+    return {(SQ_TO_RC[frm], SQ_TO_RC[to]): [SQ_TO_RC[sq] for sq in caps]
+            for frm, to, caps in side_moves(pos, player, pending)}
+
+
+class Seat:
+    def __init__(self):
+        self.token = secrets.token_hex(8)
+        self.writer = None
+
+
+class Game:
+    def __init__(self, game_id, clock, increment):
+        self.id = game_id
+        self.pos = initial_position()
+        self.turn = 1
+        self.pending = None
+        self.ply = 0
+        self.legal = legal_table(self.pos, 1)
+        self.seats = {1: Seat(), 2: Seat()}
+        self.joined = {1: False, 2: False}
+        self.engine = None  # (side, depth, time limit)
+        self.clocks = {1: float(clock), 2: float(clock)} if clock else None
+        self.increment = increment
+        self.turn_started = None
+        self.flag_timer = None
+        self.idle_timer = None
+        self.result = None
+        self.reason = None
+
+    @property
+    def started(self):
+        return all(self.joined.values())
+
+    @property
+    def connected(self):
+        return any(seat.writer is not None and not seat.writer.is_closing() for seat in self.seats.values())
+
+    def state(self, side):
+        return {
+            "type": "state",
+            "game": self.id,
+            "side": side,
+            "board": to_board(self.pos),
+            "turn": self.turn,
+            "pending": self.pending,
+            "ply": self.ply,
+            "clocks": self.clocks,
+            "result": self.result,
+            "reason": self.reason,
+        }
+
+
+class Server:
+    def __init__(self, engine_workers=1, engine_time=1.0):
+        self.games = {}
+        self.next_id = 1
+        self.engine_time = engine_time
+        self.pool = None
+        if engine_workers:
+            self.pool = ProcessPoolExecutor(max_workers=engine_workers, initializer=set_legal_cache_size,
+                                            initargs=(POOL_LEGAL_CACHE_SIZE,))
+        self.loop = None
+        self.tasks = set()  # engine turns in progress; the loop keeps only weak references
+
+    async def serve(self, host, port):
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle, host, port, limit=1 << 16)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    # Connections
+
+    async def handle(self, reader, writer):
+        held = None  # (game, seat, side) of this connection
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than the stream limit
+                    self.send(writer, {"type": "error", "reason": "message too long"})
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                    kind = msg.get("type")
+                    handler = getattr(self, "on_" + kind, None) if isinstance(kind, str) else None
+                except (ValueError, AttributeError):
+                    handler = msg = None
+                try:
+                    if handler is None:
+                        raise ValueError("bad message")
+                    held = handler(writer, msg, held) or held
+                except (ValueError, TypeError) as exc:
+                    self.send(writer, {"type": "error", "reason": str(exc)})
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if held is not None:
+                self.release(writer, held)
+            writer.close()
+
+    def send(self, writer, msg):
+        if writer is not None and not writer.is_closing():
+            writer.write(json.dumps(msg, separators=(",", ":")).encode() + b"\n")
+
+    def broadcast(self, game, msg):
+        for seat in game.seats.values():
+            self.send(seat.writer, msg)
+
+    def sit(self, writer, game, side, held):
+        # A connection holds one seat at a time; the one it held before is
+        # given up
+        seat = game.seats[side]
+        if held is not None and held[1] is not seat:
+            self.release(writer, held)
+        if seat.writer is not None and seat.writer is not writer:
+            seat.writer.close()
+        seat.writer = writer
+        game.joined[side] = True
+        self.send(writer, {"type": "seated", "game": game.id, "side": side, "token": seat.token})
+        return game, seat, side
+
+    def release(self, writer, held):
+        # The game goes on (and the clock runs); the seat can be resumed
+        game, seat, _ = held
+        if seat.writer is writer:
+            seat.writer = None
+            if game.started and game.result is None and not game.connected:
+                self.expire_after(game, IDLE_TIMEOUT)
+
+    # Requests; each returns the (game, seat, side) the connection now holds
+
+    def on_new(self, writer, msg, held):
+        # Everything is checked before the game exists, so a bad request
+        # leaves nothing behind
+        clock = setting(msg, "clock", 0, float)
+        increment = setting(msg, "increment", 0, float)
+        engine = msg.get("opponent") == "engine"
+        if engine:
+            if self.pool is None:
+                raise ValueError("no engine workers")
+            depth = setting(msg, "depth", 64, int)
+            time_limit = setting(msg, "time", self.engine_time, float)
+        game = Game(self.next_id, clock, increment)
+        self.games[game.id] = game
+        self.next_id += 1
+        side = 2 if msg.get("side") == 2 else 1
+        held = self.sit(writer, game, side, held)
+        if engine:
+            other = 3 - side
+            game.engine = (other, depth, time_limit)
+            game.joined[other] = True
+            self.start(game)
+        else:
+            self.expire_after(game, JOIN_TIMEOUT)
+        return held
+
+    def on_join(self, writer, msg, held):
+        game = self.games.get(msg.get("game"))
+        free = [side for side, joined in game.joined.items() if not joined] if game else []
+        if not free:
+            self.send(writer, {"type": "error", "reason": "no free seat"})
+            return None
+        held = self.sit(writer, game, free[0], held)
+        self.start(game)
+        return held
+
+    def on_resume(self, writer, msg, held):
+        game = self.games.get(msg.get("game"))
+        for side, candidate in (game.seats.items() if game else ()):
+            if candidate.token == msg.get("token"):
+                held = self.sit(writer, game, side, held)
+                self.send(writer, self.state(game, side))
+                return held
+        self.send(writer, {"type": "error", "reason": "unknown game or token"})
+        return None
+
+    def on_move(self, writer, msg, held):
+        if held is None:
+            self.send(writer, {"type": "error", "reason": "not in a game"})
+            return None
+        game, _, side = held
+        reason = self.play(game, side, msg.get("from"), msg.get("to"))
+        if reason:
+            self.send(writer, {"type": "error", "reason": reason})
+        return None
+
+    def on_resign(self, writer, msg, held):
+        if held is not None and held[0].result is None and held[0].started:
+            game, _, side = held
+            self.finish(game, 3 - side, "resignation")
+        return None
+
+    # Game flow
+
+    def state(self, game, side):
+        msg = game.state(side)
+        msg["clocks"] = self.clocks_now(game)
+        return msg
+
+    def clocks_now(self, game):
+        if game.clocks is None:
+            return None
+        clocks = dict(game.clocks)
+        if game.turn_started is not None:
+            clocks[game.turn] -= self.loop.time() - game.turn_started
+        return {side: round(max(left, 0.0), 3) for side, left in clocks.items()}
+
+    def start(self, game):
+        if not game.started:
+            return
+        self.expire_after(game, None)
+        for side, seat in game.seats.items():
+            self.send(seat.writer, self.state(game, side))
+        self.start_turn(game)
+
+    def start_turn(self, game):
+        if game.flag_timer is not None:
+            game.flag_timer.cancel()
+            game.flag_timer = None
+        if game.clocks is not None:
+            game.turn_started = self.loop.time()
+            game.flag_timer = self.loop.call_later(max(game.clocks[game.turn], 0.0), self.flag, game, game.ply)
+        if game.engine is not None and game.turn == game.engine[0]:
+            task = self.loop.create_task(self.engine_turn(game, game.ply))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    def expire_after(self, game, delay):
+        # (Re)starts the abandonment timer of game; None stops it
+        if game.idle_timer is not None:
+            game.idle_timer.cancel()
+            game.idle_timer = None
+        if delay is not None:
+            game.idle_timer = self.loop.call_later(delay, self.expire, game)
+
+    def expire(self, game):
+        game.idle_timer = None
+        if game.result is None and (not game.started or not game.connected):
+            self.finish(game, 0, "abandoned")
+
+    def flag(self, game, ply):
+        if game.result is None and game.ply == ply:
+            self.finish(game, 3 - game.turn, "time")
+
+    def play(self, game, side, frm, to):
+        # Returns an error reason, or None once the move has been played
+        if game.result is not None:
+            return "game is over"
+        if not game.started:
+            return "waiting for an opponent"
+        if side != game.turn:
+            return "not your turn"
+        try:
+            frm, to = (int(frm[0]), int(frm[1])), (int(to[0]), int(to[1]))
+        except (TypeError, ValueError, IndexError, KeyError):
+            return "bad square"
+        captured = game.legal.get((frm, to))
+        if captured is None:
+            return "illegal move"
+
+        if game.clocks is not None:
+            game.clocks[side] -= self.loop.time() - game.turn_started
+            if game.clocks[side] < 0:
+                self.finish(game, 3 - side, "time")
+                return "out of time"
+        to_sq = RC_TO_SQ[to]
+        game.pos = make_move(game.pos, RC_TO_SQ[frm], to_sq, [RC_TO_SQ[c] for c in captured])
+        # A jump goes on only after crowning, with the same piece
+        if captured and piece_captures(game.pos, to_sq):
+            game.pending = to
+        else:
+            game.turn, game.pending = 3 - side, None
+        game.ply += 1
+        if game.clocks is not None and game.pending is None:
+            game.clocks[side] += game.increment
+        changes = [[*frm, 0]] + [[*c, 0] for c in captured] + [[*to, game.pos.piece_at(to_sq)]]
+        game.legal = legal_table(game.pos, game.turn, game.pending)
+        self.broadcast(game, {
+            "type": "move",
+            "game": game.id,
+            "ply": game.ply,
+            "side": side,
+            "from": frm,
+            "to": to,
+            "captured": captured,
+            "changes": changes,
+            "turn": game.turn,
+            "pending": game.pending,
+            "clocks": game.clocks and {s: round(t, 3) for s, t in game.clocks.items()},
+        })
+        won = winner(game.pos) if game.pending is None else None
+        if won:
+            self.finish(game, won, "no moves")
+        else:
+            self.start_turn(game)
+        return None
+
+    async def engine_turn(self, game, ply):
+        side, depth, time_limit = game.engine
+        board = to_board(game.pos)
+        try:
+            best = await self.loop.run_in_executor(self.pool, engine_move, board, side, game.pending, depth, time_limit)
+        except RuntimeError:
+            return  # pool shut down
+        if game.result is None and game.ply == ply and best:
+            self.play(game, side, best[0], best[1])
+
+    def finish(self, game, result, reason):
+        game.result, game.reason = result, reason
+        game.turn_started = None
+        if game.flag_timer is not None:
+            game.flag_timer.cancel()
+            game.flag_timer = None
+        self.expire_after(game, None)
+        self.broadcast(game, {"type": "over", "game": game.id, "result": result, "reason": reason})
+        self.loop.call_later(FINISHED_GRACE, self.games.pop, game.id, None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Checkers game server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--engine-workers", type=int, default=1, help="processes for engine opponents, 0 for none")
+    parser.add_argument("--engine-time", type=float, default=1.0, help="engine seconds per move")
+    args = parser.parse_args(argv)
+
+    raise_file_limit()
+    server = Server(args.engine_workers, args.engine_time)
+    print(f"serving on {args.host}:{args.port}", file=sys.stderr, flush=True)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+import argparse
+import heapq
+import itertools
+import mmap
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+
+from bitboard import (BIT, RED_PROMOTION, SQ_TO_RC, WHITE_PROMOTION, Position, from_board, make_move,
+                      piece_captures, side_moves, squares)
+from rules import CLASSIC, variant_of
+
+# Endgame tablebases: win/loss/draw and distance to the end of the game for
+# every position with at most N pieces, built offline by retrograde
+# analysis and probed through a memory-mapped file.
+#
+#   python tablebase.py build --pieces 3 --out endgame.cktb
+#   python tablebase.py probe "W:WK29:B6,K1"
+#
+# File layout (little-endian): a 16-byte header (magic, version, maximum
+# piece count, entry count), then the sorted uint64 position codes, then
+# one uint16 per code: bit 15 set for a win of the side to move, the low
+# bits holding the distance in plies. Draws are not stored, so a position
+# inside the piece limit that is missing from the file is a draw.
+
+MAGIC = b"CKTB"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQ")
+WIN, DRAW, LOSS = 1, 0, -1
+
+RED_MAN_SQUARES = [sq for sq in range(32) if not BIT[sq] & RED_PROMOTION]
+WHITE_MAN_SQUARES = [sq for sq in range(32) if not BIT[sq] & WHITE_PROMOTION]
+
+
+def position_code(pos, player):
+    # Occupied squares, then two type bits per occupied square, then the
+    # side to move: exact for up to 15 pieces
+    occupied = pos.red | pos.white
+    code = occupied
+    shift = 32
+    for sq in squares(occupied):
+        code |= ((0 if pos.red & BIT[sq] else 2) + (1 if pos.kings & BIT[sq] else 0)) << shift
+        shift += 2
+    return code << 1 | (player - 1)
+
+
+def piece_count(pos):
+    return bin(pos.red | pos.white).count("1")
+
+
+def material_classes(max_pieces):
+    # (red men, red kings, white men, white kings) in solving order: fewer
+    # pieces first (captures), then fewer men (crowning turns a man into a king)
+    classes = []
+    for counts in itertools.product(range(max_pieces + 1), repeat=4):
+        rm, rk, wm, wk = counts
+        if rm + rk and wm + wk and sum(counts) <= max_pieces:
+            classes.append(counts)
+    classes.sort(key=lambda c: (sum(c), c[0] + c[2], c))
+    return classes
+
+
+def class_positions(material):
+    rm, rk, wm, wk = material
+    for red_men in itertools.combinations(RED_MAN_SQUARES, rm):
+        used = set(red_men)
+        for white_men in itertools.combinations([sq for sq in WHITE_MAN_SQUARES if sq not in used], wm):
+            used_men = used.union(white_men)
+            free = [sq for sq in range(32) if sq not in used_men]
+            for red_kings in itertools.combinations(free, rk):
+                for white_kings in itertools.combinations([sq for sq in free if sq not in red_kings], wk):
+                    red = sum(BIT[sq] for sq in red_men + red_kings)
+                    white = sum(BIT[sq] for sq in white_men + white_kings)
+                    yield Position(red, white, sum(BIT[sq] for sq in red_kings + white_kings))
+
+
+def _better(a, b):
+    # Whether outcome a = (result, distance) is preferable to b for the mover
+    if a[0] != b[0]:
+        return a[0] > b[0]
+    if a[0] == WIN:
+        return a[1] < b[1]
+    return a[1] > b[1]
+
+
+class Builder:
+    def __init__(self):
+        self.results = {}
+
+    def lookup(self, pos, player):
+        # (result, distance) of an already solved position, for player to move
+        if not pos.red or not pos.white:
+            winner = 1 if pos.red else 2
+            return (WIN if winner == player else LOSS), 0
+        return self.results[position_code(pos, player)]
+
+    def pending_value(self, pos, player, sq):
+        # A crowned piece on sq must keep capturing; every move leaves the class
+        best = None
+        for frm, to, caps in side_moves(pos, player, sq):
+            outcome = self.child_value(pos, player, frm, to, caps)
+            if best is None or _better(outcome, best):
+                best = outcome
+        return best
+
+    def child_value(self, pos, player, frm, to, caps):
+        child = make_move(pos, frm, to, caps)
+        if caps and piece_captures(child, to):
+            result, distance = self.pending_value(child, player, to)
+            return result, distance + 1
+        result, distance = self.lookup(child, 2 if player == 1 else 1)
+        return -result, distance + 1
+
+    def solve_class(self, material):
+        positions = list(class_positions(material))
+        index = {}
+        for k, pos in enumerate(positions):
+            index[position_code(pos, 1)] = 2 * k
+            index[position_code(pos, 2)] = 2 * k + 1
+        n = 2 * len(positions)
+        remaining = [0] * n
+        longest_loss = [0] * n
+        escapes = [False] * n
+        preds = [[] for _ in range(n)]
+        heap = []
+
+        for k, pos in enumerate(positions):
+            moves = {1: side_moves(pos, 1), 2: side_moves(pos, 2)}
+            winner = 2 if not moves[1] else 1 if not moves[2] else None
+            for player in (1, 2):
+                i = 2 * k + player - 1
+                if winner:
+                    heapq.heappush(heap, (0, i, WIN if winner == player else LOSS))
+                    continue
+                other = 2 if player == 1 else 1
+                for frm, to, caps in moves[player]:
+                    crowned = BIT[to] & (RED_PROMOTION if player == 1 else WHITE_PROMOTION) and not pos.kings & BIT[frm]
+                    if not caps and not crowned:
+                        # Quiet move inside this material class
+                        j = index[position_code(make_move(pos, frm, to, caps), other)]
+                        preds[j].append(i)
+                        remaining[i] += 1
+                        continue
+                    result, distance = self.child_value(pos, player, frm, to, caps)
+                    if result == WIN:
+                        heapq.heappush(heap, (distance, i, WIN))
+                    if result == LOSS:
+                        longest_loss[i] = max(longest_loss[i], distance)
+                    else:
+                        escapes[i] = True
+                if not remaining[i] and not escapes[i]:
+                    heapq.heappush(heap, (longest_loss[i], i, LOSS))
+
+        # Retrograde pass, in order of distance so every win is the fastest
+        # and every loss the slowest
+        value = [None] * n
+        while heap:
+            distance, i, result = heapq.heappop(heap)
+            if value[i] is not None:
+                continue
+            value[i] = (result, distance)
+            for p in preds[i]:
+                if value[p] is not None:
+                    continue
+                if result == LOSS:
+                    heapq.heappush(heap, (distance + 1, p, WIN))
+                else:
+                    remaining[p] -= 1
+                    longest_loss[p] = max(longest_loss[p], distance + 1)
+                    if not remaining[p] and not escapes[p]:
+                        heapq.heappush(heap, (longest_loss[p], p, LOSS))
+
+        for k, pos in enumerate(positions):
+            for player in (1, 2):
+                self.results[position_code(pos, player)] = value[2 * k + player - 1] or (DRAW, 0)
+        return len(positions) * 2
+
+
+def build(max_pieces, out_path, log=None):
+    builder = Builder()
+    for material in material_classes(max_pieces):
+        start = time.perf_counter()
+        count = builder.solve_class(material)
+        if log:
+            print(f"class {material}: {count} positions in {time.perf_counter() - start:.1f}s", file=log)
+    entries = sorted((code, (0x8000 if result == WIN else 0) | distance)
+                     for code, (result, distance) in builder.results.items() if result != DRAW)
+    with open(out_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, max_pieces, len(entries)))
+        keys = array("Q", (code for code, _ in entries))
+        values = array("H", (v for _, v in entries))
+        if sys.byteorder != "little":
+            keys.byteswap()
+            values.byteswap()
+        keys.tofile(f)
+        values.tofile(f)
+    return len(builder.results), len(entries)
+
+
+class Tablebase:
+    # Read-only view of a built table; nothing is parsed when loading
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise RuntimeError("tablebase files are little-endian")
+        self.path = path
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.max_pieces, count = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} tablebase")
+        view = memoryview(self.mm)
+        self.keys = view[HEADER.size:HEADER.size + 8 * count].cast("Q")
+        self.values = view[HEADER.size + 8 * count:HEADER.size + 10 * count].cast("H")
+
+    def close(self):
+        self.keys.release()
+        self.values.release()
+        self.mm.close()
+        self.file.close()
+
+    def covers(self, pos):
+        return piece_count(pos) <= self.max_pieces and not (pos.red & ~pos.kings & RED_PROMOTION
+                                                           or pos.white & ~pos.kings & WHITE_PROMOTION)
+
+    def probe_position(self, pos, player):
+        # (result, distance) for player to move, or None outside the table
+        if not pos.red or not pos.white:
+            return (WIN if (pos.red if player == 1 else pos.white) else LOSS), 0
+        if not self.covers(pos):
+            return None
+        code = position_code(pos, player)
+        i = bisect_left(self.keys, code)
+        if i < len(self.keys) and self.keys[i] == code:
+            v = self.values[i]
+            return (WIN if v & 0x8000 else LOSS), v & 0x7FFF
+        return DRAW, 0
+
+    def probe(self, board, player):
+        # Only positions under the classic rules, which the table is built with
+        if variant_of(board) is not CLASSIC:
+            return None
+        return self.probe_position(from_board(board), player)
+
+    def _outcome(self, pos, player, frm, to, caps):
+        child = make_move(pos, frm, to, caps)
+        if caps and piece_captures(child, to):
+            best = None
+            for mv in side_moves(child, player, to):
+                outcome = self._outcome(child, player, *mv)
+                if outcome is None:
+                    return None
+                if best is None or _better(outcome, best):
+                    best = outcome
+            return best[0], best[1] + 1
+        probed = self.probe_position(child, 2 if player == 1 else 1)
+        return None if probed is None else (-probed[0], probed[1] + 1)
+
+    def best_move(self, board, player, pending=None):
+        # Perfect (from, to, captured) plus its (result, distance), or None
+        # when the position is not covered by the table
+        if variant_of(board) is not CLASSIC:
+            return None
+        pos = from_board(board)
+        if not self.covers(pos):
+            return None
+        sq = None if pending is None else pending[0] * 4 + pending[1] // 2
+        best = None
+        for frm, to, caps in side_moves(pos, player, sq):
+            outcome = self._outcome(pos, player, frm, to, caps)
+            if outcome is None:
+                return None
+            if best is None or _better(outcome, best[1]):
+                best = ((SQ_TO_RC[frm], SQ_TO_RC[to], [SQ_TO_RC[c] for c in caps]), outcome)
+        return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe endgame tablebases")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build")
+    build_cmd.add_argument("--pieces", type=int, default=3)
+    build_cmd.add_argument("--out", default="endgame.cktb")
+    probe_cmd = sub.add_parser("probe")
+    probe_cmd.add_argument("fen")
+    probe_cmd.add_argument("--table", default="endgame.cktb")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        total, stored = build(args.pieces, args.out, log=sys.stderr)
+        print(f"{total} positions, {stored} decisive entries written to {args.out} in {time.perf_counter() - start:.1f}s")
+        return 0
+
+    from notation import fen_to_board, square_number
+    board, player = fen_to_board(args.fen)
+    table = Tablebase(args.table)
+    probed = table.probe(board, player)
+    if probed is None:
+        print(f"not in the table (more than {table.max_pieces} pieces)")
+        return 1
+    names = {WIN: "win", DRAW: "draw", LOSS: "loss"}
+    print(f"{names[probed[0]]} in {probed[1]} plies for the side to move")
+    best = table.best_move(board, player)
+    if best:
+        (frm, to, caps), _ = best
+        print(f"best move {square_number(*frm)}{'x' if caps else '-'}{square_number(*to)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+import pytest
+
+import bench_import
+
+MODULES = list(bench_import.BUDGET_MS)
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_no_heavy_imports(module):
+    assert bench_import.heavy_imports(module) == []
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_import_time_within_budget(module):
+    # Best of a few fresh interpreters, as in bench_import.py
+    ms = min(bench_import.import_time(module) for _ in range(5)) / 1000
+    assert ms <= bench_import.BUDGET_MS[module]
+
+
+def test_checkers_import_opens_no_display():
+    assert not bench_import.opens_display()
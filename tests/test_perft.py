@@ -0,0 +1,40 @@
+import pytest
+
+import perft
+from bitboard import from_board
+from notation import fen_to_board
+from rules import get_variant
+
+# Depths whose leaf count is above this are left to "python perft.py"
+MAX_NODES = 40000
+
+
+def cases(backend):
+    params = []
+    for name, variant, fen, counts in perft.REFERENCE:
+        if backend == "bitboard" and variant != "classic":
+            continue
+        depths = [(d, n) for d, n in enumerate(counts, start=1) if n <= MAX_NODES]
+        params.append(pytest.param(variant, fen, depths, id=f"{variant}-{name}"))
+    return params
+
+
+@pytest.mark.parametrize("variant, fen, depths", cases("lists"))
+def test_perft_reference(variant, fen, depths):
+    board, player = fen_to_board(fen, get_variant(variant))
+    before = [row.copy() for row in board]
+    assert [perft.perft(board, player, None, d) for d, _ in depths] == [n for _, n in depths]
+    assert board == before
+
+
+@pytest.mark.parametrize("variant, fen, depths", cases("bitboard"))
+def test_perft_reference_bitboard(variant, fen, depths):
+    board, player = fen_to_board(fen)
+    pos = from_board(board)
+    assert [perft.perft_bitboard(pos, player, None, d) for d, _ in depths] == [n for _, n in depths]
+
+
+def test_divide_adds_up():
+    board, player = fen_to_board(perft.START_FEN)
+    for backend in ("lists", "bitboard"):
+        assert sum(count(4) for _, count in perft.root_moves(board, player, backend)) == 7473
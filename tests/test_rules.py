@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+import bench_bitboard
+import bench_captures
+import rules
+from bitboard import RC_TO_SQ, from_board, side_moves, to_board
+from notation import board_to_fen, fen_to_board
+from rules import CLASSIC, VARIANTS, Variant, create_board, legal_moves, play_move, position_key
+
+# A 10x10 board with lifting at the end, to exercise the larger tables
+TEN = Variant("ten", size=10, men_rows=4, crowning="end", remove_at_end=True)
+
+
+@pytest.mark.parametrize("kings", [0.0, 0.5, 1.0])
+def test_explore_captures_matches_copying_search(kings):
+    # The in-place capture search finds the same chains as the old
+    # board-copying one and leaves the board as it was
+    bench_captures.check(bench_captures.sample_starts(1500, seed=1, king_ratio=kings))
+
+
+def test_legal_moves_match_bitboard():
+    positions = bench_bitboard.sample_positions(1500, seed=1)
+    bench_bitboard.check(positions)
+
+
+def test_bitboard_pending_captures_match():
+    # Continuations after a crowning capture, which the sampled positions
+    # above never reach
+    rng = random.Random(2)
+    checked = 0
+    for _ in range(300):
+        board, player, pending = create_board(), 1, None
+        for _ in range(120):
+            moves = legal_moves(board, player, pending)
+            if not moves:
+                break
+            if pending is not None:
+                expected = sorted((RC_TO_SQ[f], RC_TO_SQ[t], [RC_TO_SQ[x] for x in caps]) for (f, t), caps in moves.items())
+                assert sorted(side_moves(from_board(board), player, RC_TO_SQ[pending])) == expected
+                checked += 1
+            (frm, to), caps = rng.choice(list(moves.items()))
+            player, pending = play_move(board, player, frm, to, caps)
+    assert checked
+
+
+@pytest.mark.parametrize("variant", [*VARIANTS.values(), TEN], ids=lambda variant: variant.name)
+def test_legal_cache_matches_generation(variant):
+    # Cached moves and Zobrist keys agree with a fresh generation and a full
+    # rehash all through random games
+    rng = random.Random(3)
+    for _ in range(20):
+        board, player, pending = create_board(variant), 1, None
+        for _ in range(150):
+            moves = legal_moves(board, player, pending)
+            assert moves == rules._generate_legal_moves(board, player, pending)
+            assert board.key == rules.hash_board(board)
+            if not moves:
+                break
+            (frm, to), caps = rng.choice(list(moves.items()))
+            player, pending = play_move(board, player, frm, to, caps)
+
+
+def test_fen_round_trip():
+    rng = random.Random(4)
+    for variant in (CLASSIC, TEN):
+        board, player, pending = create_board(variant), 1, None
+        for _ in range(60):
+            if pending is None:
+                again, turn = fen_to_board(board_to_fen(board, player), variant)
+                assert (again, turn) == (board, player)
+                assert position_key(again, turn) == position_key(board, player)
+            moves = legal_moves(board, player, pending)
+            if not moves:
+                break
+            (frm, to), caps = rng.choice(list(moves.items()))
+            player, pending = play_move(board, player, frm, to, caps)
+    assert to_board(from_board(create_board())) == create_board()
@@ -0,0 +1,77 @@
+import queue
+import threading
+
+from rules import copy_board
+
+
+class SearchWorker:
+    # Runs Searcher.search on a background thread so the pygame loop keeps
+    # drawing; finished results come back through a queue.
+    def __init__(self, searcher):
+        self.searcher = searcher
+        self.results = queue.Queue()
+        self.thread = None
+        self.stop = threading.Event()
+        self.job = 0
+        self.preparing = None
+        self.prepare_stop = threading.Event()
+
+    @property
+    def busy(self):
+        return self.thread is not None
+
+    def prepare(self):
+        # Starts the searcher's worker processes, if it has any (see
+        # parallel.py), on another thread, so the first search need not wait
+        # for them. cancel() stops this as well.
+        start = getattr(self.searcher, "start", None)
+        if start is None or self.preparing is not None:
+            return
+        self.prepare_stop = threading.Event()
+        self.preparing = threading.Thread(target=start, args=(self.prepare_stop,), daemon=True)
+        self.preparing.start()
+
+    def start(self, board, player, pending=None):
+        self._stop_search()
+        self.job += 1
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(self.job, copy_board(board), player, pending, self.stop), daemon=True)
+        self.thread.start()
+
+    def _run(self, job, board, player, pending, stop):
+        # A search that raises still reports back, or the caller would wait
+        # for it forever
+        try:
+            best = self.searcher.search(board, player, pending, stop=stop)
+        except Exception as e:
+            self.results.put((job, None, {"error": e}))
+            return
+        self.results.put((job, best, self.searcher.stats()))
+
+    def poll(self):
+        # (best move, stats) once the current search is done, else None;
+        # after a failed search, (None, {"error": the exception})
+        while True:
+            try:
+                job, best, stats = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            if job == self.job and self.thread is not None:
+                self.thread.join()
+                self.thread = None
+                return best, stats
+
+    def cancel(self):
+        # Stop the running search and drop its result, and stop prepare()
+        self._stop_search()
+        if self.preparing is not None:
+            self.prepare_stop.set()
+            self.preparing.join()
+            self.preparing = None
+
+    def _stop_search(self):
+        if self.thread is not None:
+            self.stop.set()
+            self.thread.join()
+            self.thread = None
+        self.job += 1